@@ -3,20 +3,35 @@
 # ============================================================================
 
 # Standard Library
+import functools
+import hashlib
 import io
 import json
+import multiprocessing
 import os
+import random
 import re
+import tempfile
+import threading
 import time
 import unicodedata
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from itertools import islice, repeat
 
 # Third-Party: Flask & Extensions
 from flask import Flask, request, jsonify, session
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 
+# Third-Party: JSON
+import orjson
+
 # Third-Party: Environment & Configuration
 from dotenv import load_dotenv
 load_dotenv()
@@ -34,11 +49,14 @@ from firebase_admin import credentials, auth as firebase_auth
 
 # Third-Party: Database
 import psycopg2
+import psycopg2.extras
+import psycopg2.pool
 
 # Third-Party: PDF & Image Processing
 import pdfplumber
-from pdf2image import convert_from_bytes
-from PIL import Image
+import pymupdf
+from pdf2image import convert_from_bytes, convert_from_path, pdfinfo_from_bytes, pdfinfo_from_path
+from PIL import Image, ImageOps
 from PyPDF2 import PdfReader
 
 
@@ -46,7 +64,24 @@ from PyPDF2 import PdfReader
 # FLASK APP SETUP
 # ============================================================================
 
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson (keys sorted like Flask's default).
+
+    Types orjson can't encode natively (e.g. Decimal) go through Flask's
+    default serializer.
+    """
+
+    _options = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, default=self.default, option=self._options).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app, supports_credentials=True)
 
 # Load environment for local dev
@@ -65,6 +100,127 @@ app.config.update(
 # Initialize API clients (Study Buddy)
 gemini_client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
 
+# Quota guards for concurrent Gemini fan-out: at most GEMINI_MAX_CONCURRENCY
+# calls in flight and GEMINI_RPM calls started per minute, process-wide.
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", "60"))
+
+
+class RateLimiter:
+    """Sliding-window limiter allowing at most max_calls acquisitions per period seconds."""
+
+    def __init__(self, max_calls: int, period: float = 60.0):
+        self.max_calls = max(1, max_calls)
+        self.period = period
+        self._calls: deque[float] = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until a call slot is available in the current window."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._calls and now - self._calls[0] >= self.period:
+                    self._calls.popleft()
+                if len(self._calls) < self.max_calls:
+                    self._calls.append(now)
+                    return
+                wait = self.period - (now - self._calls[0])
+            time.sleep(wait)
+
+
+gemini_semaphore = threading.BoundedSemaphore(GEMINI_MAX_CONCURRENCY)
+gemini_rate_limiter = RateLimiter(GEMINI_RPM)
+
+
+@contextmanager
+def gemini_slot():
+    """Hold a Gemini concurrency slot and wait for rate-limit headroom."""
+    with gemini_semaphore:
+        gemini_rate_limiter.acquire()
+        yield
+
+
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "4"))
+
+
+def _is_rate_limited(e: Exception) -> bool:
+    """True for Gemini quota errors (HTTP 429 / RESOURCE_EXHAUSTED) worth retrying."""
+    return getattr(e, "code", None) == 429 or "RESOURCE_EXHAUSTED" in str(e)
+
+
+def gemini_generate(**kwargs):
+    """generate_content under a gemini_slot, retrying quota errors with jittered exponential backoff.
+
+    The backoff sleep happens outside the slot so a throttled call does not
+    hold up the others.
+    """
+    delay = 1.0
+    for attempt in range(GEMINI_MAX_RETRIES + 1):
+        try:
+            with gemini_slot():
+                return gemini_client.models.generate_content(**kwargs)
+        except Exception as e:
+            if attempt >= GEMINI_MAX_RETRIES or not _is_rate_limited(e):
+                raise
+        time.sleep(delay + random.uniform(0, delay))
+        delay *= 2
+
+
+def _close_stream(stream) -> None:
+    """Close a generate_content_stream iterator if it supports closing."""
+    close = getattr(stream, "close", None)
+    if close is not None:
+        close()
+
+
+def gemini_stream_text(**kwargs):
+    """Yield response text pieces from generate_content_stream.
+
+    The gemini_slot is held only until the first chunk arrives, i.e. while the
+    stream is being established; reading the rest of a long generation does
+    not tie up a concurrency slot. Opening the stream retries quota errors with
+    the same backoff as gemini_generate. Closing the generator early closes the
+    stream, which stops generation.
+    """
+    delay = 1.0
+    for attempt in range(GEMINI_MAX_RETRIES + 1):
+        try:
+            with gemini_slot():
+                stream = iter(gemini_client.models.generate_content_stream(**kwargs))
+                try:
+                    first = next(stream, None)
+                except BaseException:
+                    _close_stream(stream)
+                    raise
+            break
+        except Exception as e:
+            if attempt >= GEMINI_MAX_RETRIES or not _is_rate_limited(e):
+                raise
+        time.sleep(delay + random.uniform(0, delay))
+        delay *= 2
+    try:
+        if first is None:
+            return
+        text = getattr(first, "text", None)
+        if text:
+            yield text
+        for chunk in stream:
+            text = getattr(chunk, "text", None)
+            if text:
+                yield text
+    finally:
+        _close_stream(stream)
+
+
+@functools.lru_cache(maxsize=1)
+def get_vision_client() -> vision.ImageAnnotatorClient:
+    """Shared Google Vision client, created lazily so missing credentials don't break import.
+
+    A failed construction isn't cached, so the next call tries again.
+    """
+    return vision.ImageAnnotatorClient()
+
 
 # ============================================================================
 # FIREBASE ADMIN SETUP
@@ -82,18 +238,270 @@ except Exception as e:
 # DATABASE CONNECTION
 # ============================================================================
 
+# Connections are reused from a per-process pool instead of paying the TCP +
+# auth handshake on every request. Routes keep calling conn.close(); on a
+# pooled connection that hands it back to the pool.
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+
+# Decode JSONB columns (e.g. study_sets.cards) with orjson instead of the stdlib.
+psycopg2.extras.register_default_jsonb(globally=True, loads=orjson.loads)
+
+_db_pool = None
+_db_pool_lock = threading.Lock()
+# getconn() raises instead of waiting when the pool is exhausted, so callers
+# queue on this semaphore first.
+_db_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+# How long a request waits for a free connection before giving up (seconds).
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+
+
+def _get_db_pool():
+    """Create the connection pool on first use."""
+    global _db_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None:
+                _db_pool = psycopg2.pool.ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, os.getenv("DATABASE_URL"))
+    return _db_pool
+
+
+class PooledConnection:
+    """A pooled psycopg2 connection; close() rolls back any open transaction and returns it to the pool."""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        try:
+            if conn.closed:
+                self._pool.putconn(conn, close=True)
+            else:
+                conn.rollback()
+                self._pool.putconn(conn)
+        except Exception:
+            try:
+                self._pool.putconn(conn, close=True)
+            except Exception:
+                pass
+        finally:
+            _db_pool_slots.release()
+
+    def __del__(self):
+        # Safety net for code paths that return before reaching conn.close().
+        self.close()
+
+
 def get_connection():
     try:
-        return psycopg2.connect(os.getenv("DATABASE_URL"))
+        pool = _get_db_pool()
+        if not _db_pool_slots.acquire(timeout=DB_POOL_TIMEOUT):
+            print(f"Database connection failed: pool exhausted after {DB_POOL_TIMEOUT}s", flush=True)
+            return None
+        try:
+            conn = pool.getconn()
+            if conn.closed:
+                pool.putconn(conn, close=True)
+                conn = pool.getconn()
+        except Exception:
+            _db_pool_slots.release()
+            raise
+        return PooledConnection(pool, conn)
     except Exception as e:
         print("Database connection failed:", e, flush=True)
         return None
 
 
+# ============================================================================
+# UTILITY FUNCTIONS - CACHING
+# ============================================================================
+
+# Results of expensive OCR/LLM calls are stored on disk keyed by a hash of
+# their inputs, so re-uploading the same file skips Vision and Gemini.
+CACHE_DIR = os.getenv("LEARNNOVA_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "learnnova"))
+CACHE_TTL_SECONDS = int(os.getenv("LEARNNOVA_CACHE_TTL", str(7 * 24 * 3600)))
+
+
+CACHE_PRUNE_INTERVAL = int(os.getenv("LEARNNOVA_CACHE_PRUNE_INTERVAL", "3600"))
+_cache_pruned_at: dict[str, float] = {}
+_cache_prune_lock = threading.Lock()
+
+
+def _cache_prune(dirpath: str) -> None:
+    """Delete expired files in a cache namespace, at most once per CACHE_PRUNE_INTERVAL per process."""
+    now = time.time()
+    with _cache_prune_lock:
+        if now - _cache_pruned_at.get(dirpath, 0.0) < CACHE_PRUNE_INTERVAL:
+            return
+        _cache_pruned_at[dirpath] = now
+    try:
+        with os.scandir(dirpath) as it:
+            for e in it:
+                try:
+                    if e.is_file() and now - e.stat().st_mtime > CACHE_TTL_SECONDS:
+                        os.remove(e.path)
+                except OSError:
+                    continue
+    except OSError:
+        pass
+
+
+def _cache_read(path: str):
+    """Return the cached entry at path, or None if missing, expired, or unreadable.
+
+    Misses also sweep expired entries out of the namespace directory.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+        if time.time() - float(entry.get("created_at", 0)) <= CACHE_TTL_SECONDS:
+            return entry
+        os.remove(path)
+    except Exception:
+        pass
+    _cache_prune(os.path.dirname(path))
+    return None
+
+
+def _cache_write(path: str, value) -> None:
+    """Atomically write value to path (temp file + rename) so readers never see partial JSON."""
+    try:
+        dirpath = os.path.dirname(path)
+        os.makedirs(dirpath, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=dirpath, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"created_at": time.time(), "tuple": isinstance(value, tuple), "value": value}, f)
+            os.replace(tmp_path, path)
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+    except Exception as e:
+        print(f"Cache write failed: {e}", flush=True)
+
+
+def disk_cached(namespace: str, key_parts, should_cache=None):
+    """Cache a function's JSON-serializable result under CACHE_DIR/<namespace>/<key>.json.
+
+    - key_parts(*args, **kwargs) yields the bytes identifying the input; they are
+      hashed incrementally with blake2b, so large payloads are never concatenated.
+    - should_cache(result, *args, **kwargs) can veto storing a result (e.g. fallbacks).
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            try:
+                h = hashlib.blake2b(digest_size=16)
+                for part in key_parts(*args, **kwargs):
+                    h.update(part)
+                path = os.path.join(CACHE_DIR, namespace, f"{h.hexdigest()}.json")
+            except Exception:
+                return fn(*args, **kwargs)
+            entry = _cache_read(path)
+            if entry is not None:
+                value = entry.get("value")
+                return tuple(value) if entry.get("tuple") else value
+            result = fn(*args, **kwargs)
+            if should_cache is None or should_cache(result, *args, **kwargs):
+                _cache_write(path, result)
+            return result
+        return wrapper
+    return decorator
+
+
+class TTLCache:
+    """Thread-safe in-process LRU cache whose entries expire after ttl seconds."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the live value for key, or default when missing or expired."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float | None = None) -> None:
+        """Store value; ttl overrides the default lifetime for this entry."""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """Remove key and return its value (expired or not), or default."""
+        with self._lock:
+            item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+
+# Per-user list responses (courses, study sets, notes), cached in-process.
+# Every write stores a fresh revision for that (list, user) on the server, and
+# the revision is part of the key, so the user's other sessions and devices
+# miss the stale entry too. The writer's session carries the revision as well,
+# so its next list also misses the cache in worker processes that didn't see
+# the write; other sessions there may lag by at most LIST_CACHE_TTL.
+LIST_CACHE_TTL = int(os.getenv("LIST_CACHE_TTL", "30"))
+_list_cache = TTLCache(maxsize=10_000, ttl=LIST_CACHE_TTL)
+_list_revisions: dict[tuple[str, int], int] = {}
+
+
+def list_cache_key(name: str, *extra):
+    """Cache key for the current user's list `name` at its current revision."""
+    user_id = session.get("user_id")
+    return (name, user_id, _list_revisions.get((name, user_id)), session.get(f"{name}_rev"), *extra)
+
+
+def bump_list_cache(name: str) -> None:
+    """Invalidate the current user's cached `name` lists, in every session, after a write."""
+    rev = time.time_ns()
+    _list_revisions[(name, session.get("user_id"))] = rev
+    session[f"{name}_rev"] = rev
+
+
 # ============================================================================
 # UTILITY FUNCTIONS - TEXT PROCESSING
 # ============================================================================
 
+# Patterns used by sanitize_katex, compiled once at import.
+_KATEX_CTRL_RE = re.compile(r"[\x00-\x08\x0B\x0C\x0E-\x1F]")
+_KATEX_DUP_EQ_RE = re.compile(r"\b([A-Za-z])\s*=\s*\1\s*=")
+_KATEX_PMATRIX_RE = re.compile(r"(?<!\$)\\begin\{pmatrix\}([\s\S]*?)\\end\{pmatrix\}\s*\$\$")
+_KATEX_SLASH_SQRT_RE = re.compile(r"/\s*sqrt\s*\(", re.IGNORECASE)
+# "sqrt(" (unescaped, at a word boundary) and "\sqrt(" in a single pass.
+_KATEX_SQRT_PAREN_RE = re.compile(r"(?:\\|(?<!\\)\b)sqrt\s*\(")
+_KATEX_SQRT_CLOSE_RE = re.compile(r"(\\sqrt\{[^\}\n\r]*?)\)")
+_KATEX_CMDS = [
+    "frac", "binom", "sqrt", "sum", "prod", "alpha", "beta", "gamma", "delta", "epsilon",
+    "theta", "lambda", "mu", "sigma", "pi", "phi", "omega", "Omega", "ldots", "cdot",
+    "times", "leq", "geq", "neq", "pm", "mp", "overline", "underline", "hat", "bar",
+]
+# Alternatives are whole words bounded by \b, so ordering them longest-first
+# only helps the engine fail fast; it can't change what matches.
+_KATEX_CMD_RE = re.compile(r"(?<!\\)\b(" + "|".join(sorted(_KATEX_CMDS, key=len, reverse=True)) + r")\b")
+
+
 def sanitize_katex(s: str) -> str:
     """Fix common issues from LLM output that break KaTeX.
     - Remove ASCII control chars (except \n, \t)
@@ -105,13 +513,13 @@ def sanitize_katex(s: str) -> str:
             return s
         out = s
         # 1) Remove problematic control characters (keep \n, \t)
-        out = re.sub(r"[\x00-\x08\x0B\x0C\x0E-\x1F]", "", out)
+        out = _KATEX_CTRL_RE.sub("", out)
         # 2) Replace HTML entities for inequalities
         out = out.replace("&gt;", ">").replace("&lt;", "<")
 
         # 2b) Clean up some malformed math patterns commonly produced by the LLM
         #     a) Collapse duplicated scalar equalities like "A=A=" -> "A = "
-        out = re.sub(r"\b([A-Za-z])\s*=\s*\1\s*=", r"\\1 = ", out)
+        out = _KATEX_DUP_EQ_RE.sub(r"\\1 = ", out)
 
         #     b) If there's an odd number of "$$" delimiters, drop the last one to avoid
         #        leaving a stray closing display-math marker which breaks KaTeX.
@@ -126,82 +534,164 @@ def sanitize_katex(s: str) -> str:
 
         #     c) Fix patterns like "\\begin{pmatrix}...\\end{pmatrix}$$" that are missing
         #        the opening "$$" by wrapping them as a proper display block.
-        out = re.sub(
-            r"(?<!\$)\\begin\{pmatrix\}([\s\S]*?)\\end\{pmatrix\}\s*\$\$",
-            r"$$\\begin{pmatrix}\1\\end{pmatrix}$$",
-            out,
-        )
+        out = _KATEX_PMATRIX_RE.sub(r"$$\\begin{pmatrix}\1\\end{pmatrix}$$", out)
 
         # 3) Normalize common command forms
         #    3a) Fix square roots written as /sqrt(...) or sqrt(...)-> \sqrt{...}
-        out = re.sub(r"/\s*sqrt\s*\(", r"\\sqrt{", out, flags=re.IGNORECASE)
-        out = re.sub(r"(?<!\\)\bsqrt\s*\(", r"\\sqrt{", out)
-        out = re.sub(r"\\sqrt\s*\(", r"\\sqrt{", out)
+        out = _KATEX_SLASH_SQRT_RE.sub(r"\\sqrt{", out)
+        out = _KATEX_SQRT_PAREN_RE.sub(r"\\sqrt{", out)
         #    3b) Replace matching closing parenthesis after sqrt{...} with a brace if present
         #        This is a light heuristic: only replace the first unmatched ')' after a recently opened '{'
-        out = re.sub(r"(\\sqrt\{[^\}\n\r]*?)\)", r"\1}", out)
+        out = _KATEX_SQRT_CLOSE_RE.sub(r"\1}", out)
 
         #    3c) Add missing backslashes for common LaTeX commands if not already escaped
-        cmds = [
-            "frac", "binom", "sqrt", "sum", "prod", "alpha", "beta", "gamma", "delta", "epsilon",
-            "theta", "lambda", "mu", "sigma", "pi", "phi", "omega", "Omega", "ldots", "cdot",
-            "times", "leq", "geq", "neq", "pm", "mp", "overline", "underline", "hat", "bar",
-        ]
-        pattern = r"(?<!\\)\b(" + "|".join(cmds) + r")\b"
-        out = re.sub(pattern, r"\\\1", out)
+        #        Substring checks are much cheaper than the regex walk, so skip it
+        #        when no command name appears at all.
+        if any(c in out for c in _KATEX_CMDS):
+            out = _KATEX_CMD_RE.sub(r"\\\1", out)
         return out
     except Exception:
         return s
 
 
+# Scripts that tokenize at roughly one token per character: CJK ideographs,
+# kana (incl. half-width) and Hangul. Everything else, accented Latin and
+# typographic punctuation included, tokenizes close to the ASCII rate.
+_DENSE_SCRIPT_RE = re.compile(
+    "[\u1100-\u11ff\u2e80-\u2fdf\u3040-\u30ff\u3130-\u318f\u3400-\u4dbf"
+    "\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\uff66-\uffdc\U00020000-\U0003134f]"
+)
+
+
+def _char_counts(s: str) -> tuple[int, int]:
+    """(ASCII-rate, one-token-per-character) character counts of s."""
+    if s.isascii():
+        return len(s), 0
+    dense = len(_DENSE_SCRIPT_RE.findall(s))
+    return len(s) - dense, dense
+
+
+def _tokens_for_counts(light_chars: int, dense_chars: int) -> int:
+    """Token estimate for text with the given character counts (see estimate_tokens)."""
+    return max(1, light_chars // 4 + dense_chars)
+
+
 def estimate_tokens(s: str) -> int:
-    """Estimate the number of tokens in a string."""
-    return max(1, int(len(s) / 4))
+    """Estimate the number of tokens in a string.
+
+    Most text, including accented Latin and typographic quotes/dashes,
+    averages about 4 characters per token; CJK, kana and Hangul are closer to
+    one token per character.
+
+    >>> estimate_tokens("Les élèves étudient la thermodynamique — «très» naïvement.")
+    14
+    >>> estimate_tokens("熱力学の第一法則")
+    8
+    """
+    return _tokens_for_counts(*_char_counts(s))
+
+
+def _split_long_paragraph(p: str, max_chars: int) -> list[str]:
+    """Cut an oversized paragraph into pieces of at most max_chars, preferring line/word breaks."""
+    pieces: list[str] = []
+    while len(p) > max_chars:
+        cut = p.rfind("\n", 0, max_chars)
+        if cut <= 0:
+            cut = p.rfind(" ", 0, max_chars)
+        if cut <= 0:
+            cut = max_chars
+        pieces.append(p[:cut])
+        p = p[cut:].lstrip()
+    if p.strip():
+        pieces.append(p)
+    return pieces
+
+
+def _fit_paragraph(p: str, max_tokens: int) -> list[str]:
+    """Cut p into pieces that each estimate at or under max_tokens."""
+    t = estimate_tokens(p)
+    if t <= max_tokens:
+        return [p]
+    # Cut to a character budget scaled by this paragraph's own
+    # characters-per-token, so dense scripts get shorter pieces; a piece
+    # that is denser than the paragraph as a whole is cut again.
+    out: list[str] = []
+    for piece in _split_long_paragraph(p, max(1, len(p) * max_tokens // t)):
+        out.extend(_fit_paragraph(piece, max_tokens))
+    return out
 
 
 def split_by_tokens(s: str, max_tokens: int) -> list[str]:
-    """Split text into chunks by token limit."""
-    parts = [p for p in s.split("\n\n") if p.strip()]
+    """Split text into chunks by token limit.
+
+    Paragraphs are packed greedily; a paragraph that alone exceeds the limit
+    is cut into smaller pieces. Budgets are checked against the estimate of
+    the joined chunk, "\n\n" separators included, so no chunk is sent over
+    budget.
+    """
     chunks: list[str] = []
     buf: list[str] = []
-    cur = 0
-    for p in parts:
-        t = estimate_tokens(p)
-        if cur + t > max_tokens and buf:
-            chunks.append("\n\n".join(buf))
-            buf = [p]
-            cur = t
-        else:
+    # Character counts of "\n\n".join(buf); estimate_tokens of the joined
+    # text follows from them exactly without rescanning it.
+    buf_light = buf_dense = 0
+    for para in s.split("\n\n"):
+        if not para.strip():
+            continue
+        for p in _fit_paragraph(para, max_tokens):
+            light, dense = _char_counts(p)
+            if buf and _tokens_for_counts(buf_light + 2 + light, buf_dense + dense) > max_tokens:
+                chunks.append("\n\n".join(buf))
+                buf = []
+            if buf:
+                buf_light, buf_dense = buf_light + 2 + light, buf_dense + dense
+            else:
+                buf_light, buf_dense = light, dense
             buf.append(p)
-            cur += t
     if buf:
         chunks.append("\n\n".join(buf))
     return chunks
 
 
+# Display math first, so "$$...$$" is never split into two inline segments.
+_MATH_SEGMENT_RES = (re.compile(r"\$\$[\s\S]*?\$\$"), re.compile(r"\$[^$\n][\s\S]*?\$"))
+
+
 def _mask_math_segments(s: str) -> tuple[str, list[str]]:
     """Mask LaTeX math ($...$, $$...$$) to avoid accidental normalization within math."""
     if not s:
         return s, []
-    patterns = [r"\$\$[\s\S]*?\$\$", r"\$[^$\n][\s\S]*?\$"]
     originals: list[str] = []
     out = s
-    for pat in patterns:
+    for pat in _MATH_SEGMENT_RES:
         def repl(m):
             originals.append(m.group(0))
             return f"__MATH{len(originals)-1}__"
-        out = re.sub(pat, repl, out)
+        out = pat.sub(repl, out)
     return out, originals
 
 
+_MATH_PLACEHOLDER_RE = re.compile(r"__MATH(\d+)__")
+
+
 def _unmask_math_segments(s: str, originals: list[str]) -> str:
-    """Restore masked LaTeX math segments."""
+    """Restore masked LaTeX math segments in a single pass over the text."""
     if not originals:
         return s
-    out = s
-    for i, orig in enumerate(originals):
-        out = out.replace(f"__MATH{i}__", orig)
-    return out
+
+    def restore(m):
+        i = int(m.group(1))
+        return originals[i] if i < len(originals) else m.group(0)
+
+    return _MATH_PLACEHOLDER_RE.sub(restore, s)
+
+
+_GOODNOTES_RE = re.compile(r"^\s*made with\s+goodnotes\s*$", re.IGNORECASE | re.MULTILINE)
+# Every boundary str.splitlines() recognizes, so whole-text passes see the same lines.
+_LINE_BREAK_RE = re.compile(r"\r\n|[\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]")
+_LINE_EDGE_WS_RE = re.compile(r"^[^\S\n]+|[^\S\n]+$", re.MULTILINE)
+_BULLET_RE = re.compile(r"^[\-\u2022\u00B7\u2219\u25E6\u25CF\u2013\u2014]+[^\S\n]*", re.MULTILINE)
+_WS_RE = re.compile(r"[^\S\n]+")
+_BLANK_RUN_RE = re.compile(r"\n{3,}")
 
 
 def format_readable_text(s: str) -> str:
@@ -211,153 +701,413 @@ def format_readable_text(s: str) -> str:
     try:
         masked, originals = _mask_math_segments(s)
         t = unicodedata.normalize("NFKC", masked)
-        t = re.sub(r"^\s*made with\s+goodnotes\s*$", "", t, flags=re.IGNORECASE | re.MULTILINE)
+        t = _GOODNOTES_RE.sub("", t)
         t = t.replace("||", "\n").replace("|", " ")
-        lines: list[str] = []
-        for ln in t.splitlines():
-            raw = ln.strip()
-            if not raw:
-                lines.append("")
-                continue
-            raw = re.sub(r"^[\-\u2022\u00B7\u2219\u25E6\u25CF\u2013\u2014]+\s*", "- ", raw)
-            raw = raw.replace("·", "- ")
-            raw = re.sub(r"\s+", " ", raw)
-            lines.append(raw)
-        t = "\n".join(lines)
-        t = re.sub(r"\n{3,}", "\n\n", t)
+        # Line-wise cleanup as whole-text MULTILINE passes: trim each line,
+        # normalize leading bullets, then collapse runs of inline whitespace.
+        t = _LINE_BREAK_RE.sub("\n", t)
+        t = _LINE_EDGE_WS_RE.sub("", t)
+        t = _BULLET_RE.sub("- ", t)
+        t = t.replace("·", "- ")
+        t = _WS_RE.sub(" ", t)
+        t = _BLANK_RUN_RE.sub("\n\n", t)
         t = _unmask_math_segments(t, originals)
         return t.strip()
     except Exception:
         return s
 
 
+# Lines of LLM output containing any of these (case-insensitive) are dropped.
+_BANNED_SUMMARY_PHRASES = [
+    "if you'd like", "i can turn this", "would you like", "let me know",
+    "i can ", "we can ", "contact", "reach out", "tailor it",
+    "practice exam", "one-page study sheet",
+]
+_BANNED_SUMMARY_RE = re.compile("|".join(re.escape(p) for p in _BANNED_SUMMARY_PHRASES), re.IGNORECASE)
+
+
 def sanitize_summary(s: str) -> str:
     """Remove unwanted phrases from LLM-generated summaries."""
     if not s:
         return s
-    banned = [
-        "if you'd like", "i can turn this", "would you like", "let me know",
-        "i can ", "we can ", "contact", "reach out", "tailor it",
-        "practice exam", "one-page study sheet",
-    ]
     keep: list[str] = []
     for ln in (s.splitlines()):
-        low = ln.strip().lower()
-        if not low:
+        stripped = ln.strip()
+        if not stripped:
             keep.append(ln)
             continue
-        if any(p in low for p in banned):
+        if _BANNED_SUMMARY_RE.search(stripped):
             continue
         keep.append(ln)
     return "\n".join(keep).strip()
 
 
+_JSON_CLOSERS = {"[": "]", "{": "}"}
+
+
+def _json_regions(s: str) -> list[tuple[int, int]]:
+    """Return (start, end) spans of top-level balanced [...] / {...} regions in one linear pass.
+
+    Double-quoted strings (with backslash escapes) are skipped inside a region so
+    brackets in string values don't affect depth; a mismatched closer abandons
+    the region being scanned.
+    """
+    regions: list[tuple[int, int]] = []
+    stack: list[str] = []
+    start = -1
+    in_str = False
+    escaped = False
+    for i, ch in enumerate(s):
+        if in_str:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_str = False
+            continue
+        if ch == "[" or ch == "{":
+            if not stack:
+                start = i
+            stack.append(_JSON_CLOSERS[ch])
+        elif ch == "]" or ch == "}":
+            if not stack:
+                continue
+            if ch != stack[-1]:
+                stack.clear()
+                continue
+            stack.pop()
+            if not stack:
+                regions.append((start, i + 1))
+        elif ch == '"' and stack:
+            in_str = True
+    return regions
+
+
 def parse_json_lenient(s: str):
-    """Parse JSON with fallback extraction."""
+    """Parse JSON with fallback extraction.
+
+    On failure, the largest balanced top-level array/object embedded in the
+    text is parsed instead (trying smaller ones if it isn't valid JSON).
+    """
     try:
-        return json.loads(s)
+        return orjson.loads(s)
     except Exception:
-        arr_match = re.search(r"\[[\s\S]*\]", s)
-        obj_match = re.search(r"\{[\s\S]*\}", s)
-        candidate = None
-        if arr_match and obj_match:
-            candidate = arr_match.group(0) if len(arr_match.group(0)) > len(obj_match.group(0)) else obj_match.group(0)
-        elif arr_match:
-            candidate = arr_match.group(0)
-        elif obj_match:
-            candidate = obj_match.group(0)
-        if candidate:
+        regions = sorted(_json_regions(s or ""), key=lambda r: r[1] - r[0], reverse=True)
+        for start, end in regions:
             try:
-                return json.loads(candidate)
+                return orjson.loads(s[start:end])
             except Exception:
-                return {}
+                continue
         return {}
 
 
+_JSON_ARRAY_SEPARATORS = " \t\r\n,"
+
+
+def iter_json_array(pieces):
+    """Yield elements of a top-level JSON array as soon as each one is complete.
+
+    pieces is any iterable of text fragments (e.g. a streamed response). An
+    element that fails to decode is retried once more text arrives, and a bare
+    number/literal is only accepted once a ',' or ']' follows it, since it may
+    continue in the next piece. Decoding stops at the closing bracket or at the
+    first non-array input. If the input ends with an element still undecodable
+    (malformed rather than incomplete), the whole text is parsed with
+    parse_json_lenient and any elements not yet yielded follow; when even that
+    isn't an array, the object/array elements after the bad one are salvaged.
+    """
+    decoder = json.JSONDecoder()
+    parts: list[str] = []
+    buf = ""
+    pos = 0
+    started = False
+    yielded = 0
+    for piece in pieces:
+        parts.append(piece)
+        buf = buf[pos:] + piece
+        pos = 0
+        if not started:
+            stripped = buf.lstrip()
+            if not stripped:
+                continue
+            if stripped[0] != "[":
+                return
+            pos = len(buf) - len(stripped) + 1
+            started = True
+        while True:
+            while pos < len(buf) and buf[pos] in _JSON_ARRAY_SEPARATORS:
+                pos += 1
+            if pos >= len(buf):
+                break
+            if buf[pos] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                # Element not complete yet; wait for the next piece.
+                break
+            if not isinstance(item, (dict, list, str)):
+                nxt = end
+                while nxt < len(buf) and buf[nxt] in " \t\r\n":
+                    nxt += 1
+                if nxt >= len(buf) or buf[nxt] not in ",]":
+                    break
+            pos = end
+            yielded += 1
+            yield item
+    rest = buf[pos:]
+    if started and rest.strip():
+        data = parse_json_lenient("".join(parts))
+        if isinstance(data, list):
+            yield from data[yielded:]
+            return
+        for start, end in _json_regions(rest):
+            try:
+                yield orjson.loads(rest[start:end])
+            except Exception:
+                continue
+
+
 # ============================================================================
 # UTILITY FUNCTIONS - OCR
 # ============================================================================
 
+# Non-alphanumeric Latin-1 bytes; deleting them with bytes.translate counts
+# alnum characters in a single C loop instead of a per-character Python call.
+_LATIN1_NON_ALNUM = bytes(i for i in range(256) if not chr(i).isalnum())
+# Outside Latin-1, re's \w matches exactly str.isalnum() plus "_".
+_NON_ALNUM_RE = re.compile(r"[\W_]+")
+
+
+def _count_alnum(t: str) -> int:
+    """Count alphanumeric characters without a per-character Python call."""
+    try:
+        return len(t.encode("latin-1").translate(None, _LATIN1_NON_ALNUM))
+    except UnicodeEncodeError:
+        return len(_NON_ALNUM_RE.sub("", t))
+
+
+_WORD_PUNCT = ".,:;!?()[]{}'\""
+
+
+# Pure function of the text; the same extraction is often scored again (PDF
+# candidate comparison, upload checks). A small cache bounds the strings kept alive.
+@functools.lru_cache(maxsize=16)
 def ocr_quality_score(text: str) -> float:
     """Calculate quality score for OCR text."""
     t = (text or "").strip()
     if not t:
         return 0.0
     total = len(t)
-    alnum = sum(ch.isalnum() for ch in t)
+    alnum = _count_alnum(t)
     alnum_ratio = alnum / total if total else 0.0
-    lines = [ln for ln in t.splitlines() if ln.strip()]
-    if not lines:
+    # Per-line and per-word work runs through map() so the loops stay in C.
+    line_lens = [n for n in map(len, map(str.strip, t.splitlines())) if n]
+    n_lines = len(line_lens)
+    if not n_lines:
         return 0.0
-    words = t.split()
-    avg_words_line = (len(words) / max(1, len(lines)))
-    short_lines = sum(1 for ln in lines if len(ln.strip()) < 4)
-    short_ratio = short_lines / max(1, len(lines))
-    uniq_words = len(set(w.lower().strip(".,:;!?()[]{}'\"") for w in words))
+    short_lines = sum(map((4).__gt__, line_lens))
+    words = t.lower().split()
+    avg_words_line = len(words) / n_lines
+    short_ratio = short_lines / n_lines
+    uniq_words = len(set(map(str.strip, words, repeat(_WORD_PUNCT))))
     uniq_ratio = uniq_words / max(1, len(words))
     score = 0.45 * alnum_ratio + 0.35 * min(1.0, avg_words_line / 6.0) + 0.20 * uniq_ratio - 0.20 * short_ratio
     return max(0.0, min(1.0, score))
 
 
-def vision_ocr_from_images(images: list[Image.Image] | bytes) -> tuple[str, float]:
-    """Perform OCR using Google Vision API."""
-    contents: list[bytes] = []
+# Vision accepts at most 16 AnnotateImageRequests per batch_annotate_images call.
+VISION_BATCH_SIZE = 16
+
+
+# Per-page OCR result: (text, sum of word confidences, number of words with a confidence).
+VisionPageResult = tuple[str, float, int]
+
+
+def _vision_page_result(resp) -> VisionPageResult:
+    """Pull text and running word-confidence totals out of a single AnnotateImageResponse."""
+    if resp.error.message:
+        return "", 0.0, 0
+    txt = getattr(resp.full_text_annotation, "text", "") or ""
+    conf_sum = 0.0
+    conf_n = 0
+    fta = resp.full_text_annotation
+    if fta and getattr(fta, "pages", None):
+        for page in fta.pages:
+            for block in getattr(page, "blocks", []) or []:
+                for para in getattr(block, "paragraphs", []) or []:
+                    for word in getattr(para, "words", []) or []:
+                        conf = getattr(word, "confidence", None)
+                        if conf is not None:
+                            conf_sum += conf
+                            conf_n += 1
+    return txt, conf_sum, conf_n
+
+
+def _vision_ocr_batch(client, batch: list[bytes]) -> list[VisionPageResult]:
+    """OCR up to VISION_BATCH_SIZE encoded images in one round trip."""
+    requests_ = [
+        vision.AnnotateImageRequest(
+            image=vision.Image(content=content),
+            features=[vision.Feature(type_=vision.Feature.Type.DOCUMENT_TEXT_DETECTION)],
+        )
+        for content in batch
+    ]
+    try:
+        resp = client.batch_annotate_images(requests=requests_)
+    except Exception:
+        return [("", 0.0, 0)] * len(batch)
+    results: list[VisionPageResult] = []
+    for r in resp.responses:
+        try:
+            results.append(_vision_page_result(r))
+        except Exception:
+            results.append(("", 0.0, 0))
+    return results
+
+
+def _combine_vision_results(results: list[VisionPageResult]) -> tuple[str, float]:
+    """Join per-page OCR text and average the word confidences across all pages."""
+    texts: list[str] = []
+    conf_sum = 0.0
+    conf_n = 0
+    for txt, page_sum, page_n in results:
+        if txt:
+            texts.append(txt)
+        conf_sum += page_sum
+        conf_n += page_n
+    full_text = ("\n".join(texts)).strip()
+    avg_conf = conf_sum / conf_n if conf_n else (0.0 if not full_text else 0.5)
+    return full_text, avg_conf
+
+
+def _vision_cache_key(images):
+    """Cache key parts for vision_ocr_from_images: feature type plus the raw page data."""
+    yield b"DOCUMENT_TEXT_DETECTION"
     if isinstance(images, bytes):
+        yield images
+        return
+    if isinstance(images, str):
+        with open(images, "rb") as f:
+            yield f.read()
+        return
+    for im in images:
+        if isinstance(im, bytes):
+            yield im
+        elif isinstance(im, str):
+            with open(im, "rb") as f:
+                yield f.read()
+        else:
+            yield f"{im.mode}:{im.size}".encode()
+            yield im.tobytes()
+
+
+# JPEG and PNG uploads are already in a format Vision accepts; send them as-is
+# when they are upright and small enough, otherwise normalize them first.
+_VISION_PASSTHROUGH_MAGIC = (b"\xff\xd8\xff", b"\x89PNG\r\n\x1a\n")
+VISION_PASSTHROUGH_MAX_BYTES = 8 * 1024 * 1024
+_EXIF_ORIENTATION = 0x0112
+
+
+def _vision_upload_content(source: str | bytes) -> bytes:
+    """Encoded bytes for a single uploaded image (spooled file path or raw bytes).
+
+    Upright JPEG/PNG files under VISION_PASSTHROUGH_MAX_BYTES go to Vision
+    unchanged. Anything else (HEIC, TIFF, rotated photos, oversized PNGs) is
+    EXIF-transposed, converted to RGB and re-encoded as JPEG.
+    """
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            data = f.read()
+    else:
+        data = source
+    with Image.open(io.BytesIO(data)) as im:
+        if (
+            data.startswith(_VISION_PASSTHROUGH_MAGIC)
+            and len(data) <= VISION_PASSTHROUGH_MAX_BYTES
+            and im.getexif().get(_EXIF_ORIENTATION, 1) == 1
+        ):
+            return data
+        return _vision_content(ImageOps.exif_transpose(im))
+
+
+def _vision_content(im: Image.Image | str | bytes) -> bytes:
+    """Return encoded image bytes for Vision.
+
+    Encoded bytes and page files (JPEG from pdf2image) are sent unchanged;
+    only in-memory PIL images pay for an encode, as JPEG (q85) rather than
+    the slower, larger PNG.
+    """
+    if isinstance(im, bytes):
+        return im
+    if isinstance(im, str):
+        with open(im, "rb") as f:
+            return f.read()
+    pil = im.convert("RGB")
+    buf = io.BytesIO()
+    pil.save(buf, format="JPEG", quality=85)
+    return buf.getvalue()
+
+
+@disk_cached("vision_ocr", _vision_cache_key, should_cache=lambda result, images: bool(result[0]))
+def vision_ocr_from_images(images: list[Image.Image] | list[str] | list[bytes] | str | bytes) -> tuple[str, float]:
+    """Perform OCR using Google Vision API.
+
+    images may be a list of PIL images, already-encoded page bytes, or paths
+    to encoded page files (the latter two are sent as-is), or a single
+    uploaded image as a path or raw bytes (normalized by _vision_upload_content).
+    """
+    contents: list[bytes] = []
+    if isinstance(images, (str, bytes)):
         try:
-            pil = Image.open(io.BytesIO(images)).convert("RGB")
-            buf = io.BytesIO()
-            pil.save(buf, format="PNG")
-            contents.append(buf.getvalue())
+            contents.append(_vision_upload_content(images))
         except Exception:
             pass
     else:
         for im in images:
             try:
-                pil = im.convert("RGB")
-                buf = io.BytesIO()
-                pil.save(buf, format="PNG")
-                contents.append(buf.getvalue())
+                contents.append(_vision_content(im))
             except Exception:
                 continue
-    texts: list[str] = []
-    confidences: list[float] = []
-    # Lazy-initialize Google Vision client to avoid import-time failures
     try:
-        client = vision.ImageAnnotatorClient()
+        client = get_vision_client()
     except DefaultCredentialsError:
         return "", 0.0
     except Exception:
         return "", 0.0
-    for content in contents:
-        try:
-            vimg = vision.Image(content=content)
-            resp = client.document_text_detection(image=vimg)
-            if resp.error.message:
-                continue
-            txt = getattr(resp.full_text_annotation, "text", "") or ""
-            if txt:
-                texts.append(txt)
-            fta = resp.full_text_annotation
-            if fta and getattr(fta, "pages", None):
-                for page in fta.pages:
-                    for block in getattr(page, "blocks", []) or []:
-                        for para in getattr(block, "paragraphs", []) or []:
-                            for word in getattr(para, "words", []) or []:
-                                conf = getattr(word, "confidence", None)
-                                if conf is not None:
-                                    confidences.append(float(conf))
-        except Exception:
-            continue
-    full_text = ("\n".join(texts)).strip()
-    avg_conf = sum(confidences) / len(confidences) if confidences else (0.0 if not full_text else 0.5)
-    return full_text, avg_conf
+    page_results: list[VisionPageResult] = []
+    if contents:
+        # Send pages in batches of 16 and run the batch RPCs concurrently; the
+        # calls are network-bound (gRPC releases the GIL) and ex.map keeps
+        # batches, and therefore pages, in order.
+        batches = [contents[i:i + VISION_BATCH_SIZE] for i in range(0, len(contents), VISION_BATCH_SIZE)]
+        with ThreadPoolExecutor(max_workers=min(16, len(batches))) as ex:
+            for results in ex.map(lambda b: _vision_ocr_batch(client, b), batches):
+                page_results.extend(results)
+    return _combine_vision_results(page_results)
 
 
-def clean_text_with_gemini(text: str) -> str:
-    """Use Gemini Flash Lite to clean text artifacts (OCR or otherwise)."""
+# Part of the clean_text cache key; bump it whenever the clean_text_with_gemini
+# prompts change so stale cleanups are regenerated instead of served.
+CLEAN_PROMPT_VERSION = "1"
+
+
+def _clean_text_cache_key(text: str):
+    """Cache key parts for clean_text_with_gemini: entry format, model name, prompt version, and the input text."""
+    yield f"v2|gemini-2.5-flash-lite|prompt-v{CLEAN_PROMPT_VERSION}|".encode()
+    yield (text or "").strip().encode("utf-8", "surrogatepass")
+
+
+@disk_cached("clean_text", _clean_text_cache_key, should_cache=lambda result, text: bool(result[0]) and result[1])
+def _clean_text(text: str) -> tuple[str, bool]:
+    """clean_text_with_gemini plus whether Gemini actually returned a cleanup.
+
+    On failure the input comes back unchanged with False, and is not cached.
+    """
     t = (text or "").strip()
     if not t:
-        return t
+        return t, True
     snippet = t if len(t) <= 30000 else t[:30000]
     system_msg = (
         "You are a text cleanup assistant. Clean OCR text: fix broken line wraps and hyphenations, "
@@ -376,42 +1126,175 @@ def clean_text_with_gemini(text: str) -> str:
         f"TEXT:\n{snippet}"
     )
     try:
-        resp = gemini_client.models.generate_content(
+        resp = gemini_generate(
             model="gemini-2.5-flash-lite",
             contents=system_msg + "\n\n" + prompt,
         )
         out = (getattr(resp, "text", None) or "").strip()
         print("Was not cleaned properly" if out == t else "Was cleaned properly", flush=True)
-        return out or t
+        return (out, True) if out else (t, False)
     except Exception as e:
         print(f"Failed to clean text: {e}", flush=True)
-        return t
+        return t, False
+
+
+def clean_text_with_gemini(text: str) -> str:
+    """Use Gemini Flash Lite to clean text artifacts (OCR or otherwise)."""
+    return _clean_text(text)[0]
 
 
 # ============================================================================
 # UTILITY FUNCTIONS - PDF PROCESSING
 # ============================================================================
 
-def extract_pdf_text_and_tables(file_bytes: bytes) -> tuple[str, list[list[list[str]]]]:
-    """Extract text and tables from PDF."""
-    extracted_text = ""
+# A PDF is passed around either as a filesystem path (uploads are spooled to a
+# temp file) or as raw bytes.
+PdfSource = str | bytes
+
+
+def _pdf_stream(source: PdfSource):
+    """Return something pdfplumber/PyPDF2 can open: the path itself, or a BytesIO over raw bytes."""
+    return source if isinstance(source, str) else io.BytesIO(source)
+
+
+def _open_pymupdf(source: PdfSource):
+    """Open a PDF with PyMuPDF from a path or raw bytes."""
+    if isinstance(source, str):
+        return pymupdf.open(source)
+    return pymupdf.open(stream=source, filetype="pdf")
+
+
+def _iter_source_chunks(source: PdfSource, chunk_size: int = 1 << 20):
+    """Yield the PDF's bytes in chunks without reading a path into memory at once."""
+    if not isinstance(source, str):
+        yield source
+        return
+    with open(source, "rb") as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+# pdfminer parsing is CPU-bound and not thread-safe on a shared document, so
+# long PDFs are split into contiguous page ranges parsed in worker processes.
+PDF_PARALLEL_MIN_PAGES = 8
+PDF_WORKERS = max(1, min(8, os.cpu_count() or 1))
+# Resolution for pages rendered for OCR. Vision reads body text reliably from
+# ~150 DPI; 200 keeps small print legible at under half the pixels of 300.
+PDF_RENDER_DPI = int(os.getenv("PDF_RENDER_DPI", "200"))
+
+
+def _extract_page_range(source: PdfSource, start: int, end: int | None, with_tables: bool = True) -> list[tuple[str, list[list[list[str]]]]]:
+    """Extract (text, tables) for pages [start, end) of a PDF.
+
+    Each page is closed once read, dropping pdfplumber's cached layout
+    objects so memory stays bounded by one page rather than the document.
+    """
+    out: list[tuple[str, list[list[list[str]]]]] = []
+    with pdfplumber.open(_pdf_stream(source)) as pdf:
+        for page in pdf.pages[start:end]:
+            try:
+                text = page.extract_text() or ""
+                tables = page.extract_tables() if with_tables else []
+            finally:
+                page.close()
+            out.append((text, tables))
+    return out
+
+
+# One pdfminer worker pool shared by all requests. Workers are started via
+# forkserver (spawn where unavailable), never by forking this threaded server
+# process, whose gRPC and DB pool threads may hold locks at fork time.
+_pdf_pool: ProcessPoolExecutor | None = None
+_pdf_pool_lock = threading.Lock()
+
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    """Return the shared PDF_WORKERS-sized process pool, creating it on first use."""
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pdf_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context(method))
+        return _pdf_pool
+
+
+def _reset_pdf_pool() -> None:
+    """Drop a broken pool so the next caller starts a fresh one."""
+    global _pdf_pool
+    with _pdf_pool_lock:
+        pool, _pdf_pool = _pdf_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _extract_pages(source: PdfSource, with_tables: bool = True) -> list[tuple[str, list[list[list[str]]]]]:
+    """Extract (text, tables) for every page, in page order.
+
+    The page count comes from PyMuPDF's xref rather than pdfplumber, so a
+    long PDF is only parsed by pdfminer inside the workers, not once more in
+    the parent just to size the ranges.
+    """
+    try:
+        with _open_pymupdf(source) as doc:
+            n_pages = doc.page_count
+    except Exception:
+        n_pages = 0
+    if n_pages < PDF_PARALLEL_MIN_PAGES or PDF_WORKERS < 2:
+        return _extract_page_range(source, 0, None, with_tables)
+    step = -(-n_pages // PDF_WORKERS)
+    starts = list(range(0, n_pages, step))
+    ends = [min(st + step, n_pages) for st in starts]
+    try:
+        chunks = list(_get_pdf_pool().map(_extract_page_range, repeat(source), starts, ends, repeat(with_tables)))
+    except BrokenProcessPool as e:
+        print(f"PDF worker pool broke, extracting serially: {e}", flush=True)
+        _reset_pdf_pool()
+        return _extract_page_range(source, 0, None, with_tables)
+    return [item for chunk in chunks for item in chunk]
+
+
+def _extract_pages_pymupdf(source: PdfSource, with_tables: bool = True) -> list[tuple[str, list[list[list[str]]]]]:
+    """Extract (text, tables) for every page with PyMuPDF's C engine."""
+    out: list[tuple[str, list[list[list[str]]]]] = []
+    with _open_pymupdf(source) as doc:
+        for page in doc:
+            text = page.get_text("text") or ""
+            tables = [t.extract() for t in page.find_tables().tables] if with_tables else []
+            out.append((text.strip(), tables))
+    return out
+
+
+def extract_pdf_text_and_tables(source: PdfSource, with_tables: bool = True) -> tuple[str, list[list[list[str]]]]:
+    """Extract text and tables from PDF.
+
+    PyMuPDF is tried first; pdfplumber is the fallback only when it fails.
+    A PDF with no text layer (a scan) comes back empty rather than being
+    re-parsed by pdfminer. with_tables=False skips table detection for
+    text-only callers.
+    """
+    try:
+        pages = _extract_pages_pymupdf(source, with_tables=with_tables)
+    except Exception as e:
+        print(f"PyMuPDF extraction failed, falling back to pdfplumber: {e}", flush=True)
+        pages = _extract_pages(source, with_tables=with_tables)
+    texts: list[str] = []
     extracted_tables: list[list[list[str]]] = []
-    with pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
-        for page in pdf.pages:
-            text = page.extract_text()
-            if text:
-                extracted_text += text + "\n"
-            tables = page.extract_tables()
-            for table in tables:
-                extracted_tables.append(table)
-    return extracted_text.strip(), extracted_tables
+    for text, tables in pages:
+        if text:
+            texts.append(text)
+        extracted_tables.extend(tables)
+    return "\n".join(texts).strip(), extracted_tables
 
 
-def walk_outlines(items, level, reader: PdfReader, page_map, results: list[tuple[str, int, int]]):
-    """Recursively walk PDF outline structure."""
+def walk_outlines(items, level, page_map, id_map, results: list[tuple[str, int, int]]):
+    """Recursively walk PDF outline structure.
+
+    page_map maps a page's indirect reference to its index and id_map maps
+    id(page object) to its index, so each destination resolves in O(1).
+    """
     for it in items:
         if isinstance(it, list):
-            walk_outlines(it, level + 1, reader, page_map, results)
+            walk_outlines(it, level + 1, page_map, id_map, results)
             continue
         title = getattr(it, "title", None) or it.get("/Title", "Untitled")
         dest = (
@@ -424,100 +1307,273 @@ def walk_outlines(items, level, reader: PdfReader, page_map, results: list[tuple
         )
         if dest is None:
             continue
-        if hasattr(dest, "get_object"):
-            dest = dest.get_object()
-        pg_idx = None
-        if hasattr(dest, "indirect_reference") and dest.indirect_reference in page_map:
-            pg_idx = page_map[dest.indirect_reference]
-        else:
-            for i, p in enumerate(reader.pages):
-                if p is dest:
-                    pg_idx = i
-                    break
+        if isinstance(dest, list):
+            # Explicit destination array ([page_ref, /XYZ, left, top, zoom]):
+            # the page reference is the first element.
+            if not dest:
+                continue
+            dest = dest[0]
+        # A bare page reference resolves straight from page_map without
+        # loading the page object.
+        pg_idx = page_map.get(dest) if hasattr(dest, "idnum") else None
+        if pg_idx is None:
+            if hasattr(dest, "get_object"):
+                dest = dest.get_object()
+            pg_idx = id_map.get(id(dest))
+            if pg_idx is None and hasattr(dest, "indirect_reference"):
+                pg_idx = page_map.get(dest.indirect_reference)
         if pg_idx is not None:
             results.append((str(title).strip(), pg_idx, level))
 
 
-def get_pdf_outlines(file_bytes: bytes) -> list[tuple[str, int]]:
+def get_pdf_outlines(source: PdfSource) -> list[tuple[str, int]]:
     """Extract PDF bookmarks/outlines."""
     try:
-        reader = PdfReader(io.BytesIO(file_bytes))
+        reader = PdfReader(_pdf_stream(source))
         outlines = getattr(reader, "outlines", None) or getattr(reader, "outline", None)
         results: list[tuple[str, int, int]] = []
-        page_map = {getattr(p, "indirect_reference", None): i for i, p in enumerate(reader.pages)}
+        # Materialize the lazy page list once; it also keeps the page objects
+        # alive so the id() keys stay valid while walking.
+        pages = list(reader.pages)
+        page_map = {}
+        id_map = {}
+        for i, p in enumerate(pages):
+            # Pages without an indirect reference must not share a None key.
+            ref = getattr(p, "indirect_reference", None)
+            if ref is not None:
+                page_map.setdefault(ref, i)
+            id_map[id(p)] = i
         if outlines:
-            walk_outlines(outlines, 0, reader, page_map, results)
-        results = [r for r in results if r[2] <= 1]
-        results.sort(key=lambda x: x[1])
-        uniq: list[tuple[str, int]] = []
-        seen = set()
-        for t, p, lvl in results:
-            key = (t.lower(), p)
-            if key not in seen:
-                uniq.append((t, p))
-                seen.add(key)
-        return uniq
+            walk_outlines(outlines, 0, page_map, id_map, results)
+        return _top_level_marks(results)
     except Exception:
         return []
 
 
-def extract_sections_by_bookmarks(file_bytes: bytes) -> tuple[list[tuple[str, str]], str | None]:
-    """Extract PDF sections based on bookmarks."""
-    marks = get_pdf_outlines(file_bytes)
+def _top_level_marks(results: list[tuple[str, int, int]]) -> list[tuple[str, int]]:
+    """Keep the first two outline levels, sorted by page, without duplicates."""
+    results = [r for r in results if r[2] <= 1]
+    results.sort(key=lambda x: x[1])
+    uniq: list[tuple[str, int]] = []
+    seen = set()
+    for t, p, lvl in results:
+        key = (t.lower(), p)
+        if key not in seen:
+            uniq.append((t, p))
+            seen.add(key)
+    return uniq
+
+
+def _bookmarks_and_pages_pymupdf(source: PdfSource) -> tuple[list[tuple[str, int]], list[str]]:
+    """Read the outline and every page's text from a single PyMuPDF document."""
+    with _open_pymupdf(source) as doc:
+        # get_toc levels are 1-based and pages 1-based (< 1 when unresolved).
+        results = [(str(title).strip(), pno - 1, lvl - 1) for lvl, title, pno in doc.get_toc(simple=True) if pno >= 1]
+        marks = _top_level_marks(results)
+        if not marks:
+            return [], []
+        return marks, [page.get_text("text") or "" for page in doc]
+
+
+def extract_sections_by_bookmarks(source: PdfSource) -> tuple[list[tuple[str, str]], str | None]:
+    """Extract PDF sections based on bookmarks.
+
+    The outline and page text come from one open PyMuPDF document; PyPDF2 and
+    pdfplumber are only opened when that fails.
+    """
+    try:
+        marks, page_texts = _bookmarks_and_pages_pymupdf(source)
+    except Exception:
+        marks = get_pdf_outlines(source)
+        page_texts = []
     if len(marks) < 1:
         return [], None
     try:
-        with pdfplumber.open(io.BytesIO(file_bytes)) as pdfx:
-            n_pages = len(pdfx.pages)
-            ranges: list[tuple[str, int, int]] = []
-            for i, (title, start) in enumerate(marks):
-                end = (marks[i + 1][1] - 1) if i + 1 < len(marks) else (n_pages - 1)
-                start = max(0, min(start, n_pages - 1))
-                end = max(start, min(end, n_pages - 1))
-                ranges.append((title.strip(), start, end))
-            sections: list[tuple[str, str]] = []
-            for title, s, e in ranges:
-                buf: list[str] = []
-                for pi in range(s, e + 1):
-                    txtp = pdfx.pages[pi].extract_text() or ""
-                    if txtp:
-                        buf.append(txtp)
-                text_sec = ("\n".join(buf)).strip()
-                if text_sec:
-                    sections.append((title, text_sec))
-            if sections:
-                parts: list[str] = []
-                for title, body in sections:
-                    parts.append(f"=== SECTION START ===\nTitle: {title}\n\n{body}\n=== SECTION END ===")
-                delineated = "\n\n".join(parts)
-            else:
-                delineated = None
-            return sections, delineated
+        if not page_texts:
+            page_texts = [text for text, _ in _extract_pages(source, with_tables=False)]
+        n_pages = len(page_texts)
+        if n_pages == 0:
+            return [], None
+        sections: list[tuple[str, str]] = []
+        for i, (title, start) in enumerate(marks):
+            end = (marks[i + 1][1] - 1) if i + 1 < len(marks) else (n_pages - 1)
+            start = max(0, min(start, n_pages - 1))
+            end = max(start, min(end, n_pages - 1))
+            text_sec = "\n".join(t for t in page_texts[start:end + 1] if t).strip()
+            if text_sec:
+                sections.append((title.strip(), text_sec))
+        if sections:
+            parts: list[str] = []
+            for title, body in sections:
+                parts.append(f"=== SECTION START ===\nTitle: {title}\n\n{body}\n=== SECTION END ===")
+            delineated = "\n\n".join(parts)
+        else:
+            delineated = None
+        return sections, delineated
     except Exception:
         return [], None
 
 
-def extract_pdf_text(file_bytes: bytes) -> str:
-    """Extract and clean text from PDF using best available method."""
-    structured_text, _ = extract_pdf_text_and_tables(file_bytes)
+def _pdf_text_cache_key(source: PdfSource):
+    """Cache key parts for extract_pdf_text: entry format, render DPI, OCR feature, cleanup model and prompt, file bytes."""
+    yield f"v2|dpi={PDF_RENDER_DPI}|DOCUMENT_TEXT_DETECTION|gemini-2.5-flash-lite|clean-v{CLEAN_PROMPT_VERSION}|".encode()
+    yield from _iter_source_chunks(source)
+
+
+def _render_pdf_pages(source: PdfSource, output_folder: str, first_page: int | None = None, last_page: int | None = None) -> list[str]:
+    """Render PDF pages to JPEG files in output_folder and return their paths.
+
+    Pages go straight to disk on poppler's own threads rather than being held
+    in memory as PIL images and re-encoded.
+    """
+    convert = convert_from_path if isinstance(source, str) else convert_from_bytes
+    return convert(
+        source,
+        dpi=PDF_RENDER_DPI,
+        fmt="jpeg",
+        jpegopt={"quality": 85, "optimize": True},
+        thread_count=PDF_WORKERS,
+        output_folder=output_folder,
+        paths_only=True,
+        first_page=first_page,
+        last_page=last_page,
+    )
+
+
+def _pdf_page_count(source: PdfSource) -> int:
+    """Page count as reported by poppler, or 0 when it cannot be read."""
+    try:
+        pdfinfo = pdfinfo_from_path if isinstance(source, str) else pdfinfo_from_bytes
+        return int(pdfinfo(source).get("Pages") or 0)
+    except Exception:
+        return 0
+
+
+def _vision_ocr_rendered(source: PdfSource, output_folder: str) -> tuple[str, float]:
+    """Render and OCR a PDF one VISION_BATCH_SIZE slice at a time.
+
+    Each slice's Vision request is in flight while poppler renders the next
+    one, so rasterization and OCR overlap instead of running back to back.
+    """
+    n_pages = _pdf_page_count(source)
+    if n_pages <= VISION_BATCH_SIZE:
+        return vision_ocr_from_images(_render_pdf_pages(source, output_folder))
+    try:
+        client = get_vision_client()
+    except Exception:
+        return "", 0.0
+    futures = []
+    with ThreadPoolExecutor(max_workers=4) as ex:
+        for first in range(1, n_pages + 1, VISION_BATCH_SIZE):
+            last = min(first + VISION_BATCH_SIZE - 1, n_pages)
+            paths = _render_pdf_pages(source, output_folder, first_page=first, last_page=last)
+            futures.append(ex.submit(_vision_ocr_batch, client, [_vision_content(p) for p in paths]))
+        page_results = [r for f in futures for r in f.result()]
+    return _combine_vision_results(page_results)
+
+
+def _vision_sample_worthwhile(source: PdfSource, output_folder: str, score_struct: float) -> bool | None:
+    """OCR the first, middle and last pages to decide whether a full Vision pass would beat the text layer.
+
+    Returns None when the sample OCR produced no text (Vision unavailable).
+    """
+    n_pages = _pdf_page_count(source)
+    if n_pages <= 3:
+        return True
+    paths: list[str] = []
+    for pno in sorted({1, (n_pages + 1) // 2, n_pages}):
+        paths.extend(_render_pdf_pages(source, output_folder, first_page=pno, last_page=pno))
+    sample_text, _ = vision_ocr_from_images(paths)
+    if not (sample_text or "").strip():
+        return None
+    return ocr_quality_score(sample_text) >= score_struct + 0.05
+
+
+# Vision reads PDFs natively (batch_annotate_files, at most 5 pages per
+# request), so short documents skip local rasterization entirely.
+VISION_FILE_MAX_PAGES = 5
+VISION_FILE_MAX_BYTES = 10 * 1024 * 1024
+
+
+def _vision_ocr_pdf_file(source: PdfSource) -> tuple[str, float] | None:
+    """OCR a short PDF by sending the file itself to Vision; None if it is too long or the call fails."""
+    try:
+        size = os.path.getsize(source) if isinstance(source, str) else len(source)
+        if size > VISION_FILE_MAX_BYTES:
+            return None
+        with _open_pymupdf(source) as doc:
+            n_pages = doc.page_count
+        if not 0 < n_pages <= VISION_FILE_MAX_PAGES:
+            return None
+        client = get_vision_client()
+        request_ = vision.AnnotateFileRequest(
+            input_config=vision.InputConfig(mime_type="application/pdf", content=b"".join(_iter_source_chunks(source))),
+            features=[vision.Feature(type_=vision.Feature.Type.DOCUMENT_TEXT_DETECTION)],
+            pages=list(range(1, n_pages + 1)),
+        )
+        resp = client.batch_annotate_files(requests=[request_])
+        page_responses = resp.responses[0].responses
+    except Exception:
+        return None
+    page_results: list[VisionPageResult] = []
+    for r in page_responses:
+        try:
+            page_results.append(_vision_page_result(r))
+        except Exception:
+            continue
+    return _combine_vision_results(page_results)
+
+
+@disk_cached("pdf_text", _pdf_text_cache_key, should_cache=lambda result, source: bool(result[0]) and result[1])
+def _extract_pdf_text(source: PdfSource) -> tuple[str, bool]:
+    """extract_pdf_text plus whether every step it relied on succeeded.
+
+    The flag is False when Vision or the Gemini cleanup failed and the text is
+    a degraded fallback; those results are returned but not cached.
+    """
+    structured_text, _ = extract_pdf_text_and_tables(source, with_tables=False)
     structured_text = (structured_text or "").strip()
     score_struct = ocr_quality_score(structured_text)
+    if score_struct >= 0.70 and len(structured_text) > 200:
+        return format_readable_text(structured_text), True
     vision_text = ""
 
     conf = 0.0
     try:
-        pages = convert_from_bytes(file_bytes, dpi=300)
-        vision_text, conf = vision_ocr_from_images(pages)
+        file_ocr = _vision_ocr_pdf_file(source)
+        if file_ocr is not None and file_ocr[0]:
+            vision_text, conf = file_ocr
+        else:
+            with tempfile.TemporaryDirectory(prefix="learnnova-pages-") as tmpdir:
+                if score_struct >= 0.5 and len(structured_text) > 500:
+                    worthwhile = _vision_sample_worthwhile(source, tmpdir, score_struct)
+                    if not worthwhile:
+                        return format_readable_text(structured_text), worthwhile is not None
+                vision_text, conf = _vision_ocr_rendered(source, tmpdir)
     except Exception:
         vision_text, conf = "", 0.0
     vision_text = (vision_text or "").strip()
+    # Vision errors are swallowed into empty text; an empty pass is treated as
+    # a failure so a momentary outage doesn't pin the fallback in the cache.
+    ok = bool(vision_text)
     score_vision = ocr_quality_score(vision_text)
     prefer_vision = (conf >= 0.55) or (score_vision >= score_struct + 0.05)
     chosen = vision_text if prefer_vision else structured_text
     if prefer_vision and chosen:
-        cleaned = clean_text_with_gemini(chosen)
-        return format_readable_text(cleaned)
-    return format_readable_text(chosen)
+        cleaned, cleaned_ok = _clean_text(chosen)
+        return format_readable_text(cleaned), ok and cleaned_ok
+    return format_readable_text(chosen), ok
+
+
+def extract_pdf_text(source: PdfSource) -> str:
+    """Extract and clean text from PDF using best available method.
+
+    Vision OCR is only used when the embedded text layer looks poor: a good
+    layer is returned directly, and a borderline one is checked against a
+    three-page OCR sample before paying for a full pass. Short PDFs are sent
+    to Vision as-is; longer ones are rendered to JPEG pages first.
+    """
+    return _extract_pdf_text(source)[0]
 
 
 # ============================================================================
@@ -525,7 +1581,7 @@ def extract_pdf_text(file_bytes: bytes) -> str:
 # ============================================================================
 
 def summarize_once(content: str, system_msg: str = "You are a helpful assistant that writes succinct study notes.", model: str = "gemini-2.5-flash-lite") -> str:
-    """Generate a single summary using Gemini."""
+    """Generate a single summary using Gemini; raises RuntimeError if both prompts fail."""
     prompt = (
         "Summarize the following content into clear, concise bullet points. "
         "If the content contains sections, delineate your summary with section headers. "
@@ -533,7 +1589,7 @@ def summarize_once(content: str, system_msg: str = "You are a helpful assistant
         "Output only the summary.\n\nCONTENT:\n" + content
     )
     try:
-        resp = gemini_client.models.generate_content(
+        resp = gemini_generate(
             model=model,
             contents=system_msg + "\n\n" + prompt,
         )
@@ -547,47 +1603,69 @@ def summarize_once(content: str, system_msg: str = "You are a helpful assistant
         "No intro or outro, bullets only. No meta commentary or offers.\n\nCONTENT:\n" + content
     )
     try:
-        resp2 = gemini_client.models.generate_content(
+        resp2 = gemini_generate(
             model=model,
             contents=system_msg + "\n\n" + strict_prompt,
         )
         out2 = (getattr(resp2, "text", None) or "").strip()
         if out2:
             return sanitize_summary(out2)
-    except Exception:
-        pass
-    return content[:1200]
+    except Exception as e:
+        raise RuntimeError(f"summary generation failed: {e}") from e
+    raise RuntimeError("summary generation returned no text")
+
+
+# Part of the summary cache key; bump it whenever the summarize_once prompts
+# change so stale summaries are regenerated instead of served.
+SUMMARY_PROMPT_VERSION = "1"
 
 
-def summarize_text(text: str) -> str:
-    """Summarize text with chunking for large inputs."""
+def _summary_cache_key(text: str):
+    """Cache key parts for summarize_text: entry format, model name, prompt version, and the input text."""
+    yield f"v2|gemini-2.5-flash-lite|prompt-v{SUMMARY_PROMPT_VERSION}|".encode()
+    yield (text or "").strip().encode("utf-8", "surrogatepass")
+
+
+@disk_cached("summary", _summary_cache_key, should_cache=lambda result, text: bool(result[0]) and result[1])
+def _summarize_text(text: str) -> tuple[str, bool]:
+    """summarize_text plus whether every Gemini call succeeded.
+
+    A failed call leaves a prefix of its input in place of a summary (for a
+    large document, only in that chunk's slot); such results are returned
+    with False and not cached.
+    """
     txt = (text or "").strip()
     if not txt:
-        return ""
+        return "", True
     try:
         total_tokens = estimate_tokens(txt)
         if total_tokens > 200000:
             chunks = split_by_tokens(txt, max_tokens=10000)
-            partial_summaries: list[str] = []
-            for ch in chunks:
+
+            def summarize_chunk(ch: str) -> tuple[str, bool]:
                 try:
-                    partial = summarize_once(ch, model="gemini-2.5-flash-lite")
-                except Exception:
-                    raise RuntimeError("file too large to be summarized.")
-                partial_summaries.append(partial)
-                time.sleep(1)
-            combined = "\n\n".join(partial_summaries)
-            try:
-                return summarize_once(combined, system_msg="You write concise combined summaries of bullet-point notes.", model="gemini-2.5-flash-lite")
-            except Exception:
-                raise RuntimeError("file too large to be summarized.")
-        else:
-            try:
-                return summarize_once(txt, model="gemini-2.5-flash-lite")
-            except Exception:
-                raise RuntimeError("file too large to be summarized.")
-    except Exception:
-        return txt[:1200]
+                    return summarize_once(ch, model="gemini-2.5-flash-lite"), True
+                except Exception as e:
+                    print(f"Chunk summary failed: {e}", flush=True)
+                    return ch[:1200], False
+
+            # Chunks are independent, so summarize them concurrently. Each
+            # summarize_once call takes a gemini_slot, which replaces the old
+            # fixed 1s sleep between chunks.
+            with ThreadPoolExecutor(max_workers=max(1, min(GEMINI_MAX_CONCURRENCY, len(chunks)))) as ex:
+                partials = list(ex.map(summarize_chunk, chunks))
+            combined = "\n\n".join(p for p, _ in partials)
+            summary = summarize_once(combined, system_msg="You write concise combined summaries of bullet-point notes.", model="gemini-2.5-flash-lite")
+            return summary, all(ok for _, ok in partials)
+        return summarize_once(txt, model="gemini-2.5-flash-lite"), True
+    except Exception as e:
+        print(f"Summary failed: {e}", flush=True)
+        return txt[:1200], False
+
+
+def summarize_text(text: str) -> str:
+    """Summarize text with chunking for large inputs."""
+    return _summarize_text(text)[0]
 
 
 # ============================================================================
@@ -609,8 +1687,15 @@ def ensure_minimum_summary(summary: str, size: str) -> tuple[bool, str]:
     return True, ""
 
 
-def to_index_from_answer(ans: str | int | None, options: list[str]) -> int | None:
-    """Convert answer to option index."""
+_ANSWER_LETTERS = {"a": 0, "b": 1, "c": 2, "d": 3}
+
+
+def to_index_from_answer(ans: str | int | None, options: list[str], opt_index: dict[str, int] | None = None) -> int | None:
+    """Convert answer to option index.
+
+    opt_index, when given, maps option text to its first index so callers
+    probing several answer fields can build it once.
+    """
     if ans is None:
         return None
     if isinstance(ans, int):
@@ -618,20 +1703,141 @@ def to_index_from_answer(ans: str | int | None, options: list[str]) -> int | Non
     s = str(ans).strip()
     if not s:
         return None
-    letters = {"a": 0, "b": 1, "c": 2, "d": 3}
     low = s.lower()
-    if low in letters:
-        return letters[low]
+    if low in _ANSWER_LETTERS:
+        return _ANSWER_LETTERS[low]
     if low.startswith("option "):
         try:
             n = int(low.split("option ", 1)[1]) - 1
             return n if 0 <= n < len(options) else None
         except Exception:
             pass
-    try:
-        return options.index(s)
-    except ValueError:
-        return None
+    if opt_index is None:
+        opt_index = _option_index(options)
+    return opt_index.get(s)
+
+
+# Answer options repeat heavily across questions ("None of the above",
+# "True"/"False", shared distractors), so their sanitized form is memoized.
+_sanitize_option = functools.lru_cache(maxsize=1024)(sanitize_katex)
+
+
+def _option_index(options: list[str]) -> dict[str, int]:
+    """Map each option string to the index of its first occurrence."""
+    index: dict[str, int] = {}
+    for i, o in enumerate(options):
+        index.setdefault(o, i)
+    return index
+
+
+def _question_key(question: str) -> bytes:
+    """Short digest of a question ignoring case, spacing and punctuation, for duplicate detection."""
+    return hashlib.blake2b(_NON_ALNUM_RE.sub("", question.lower()).encode("utf-8"), digest_size=8).digest()
+
+
+def _normalize_questions(items, count: int, with_topic: bool = True) -> list[dict]:
+    """Coerce raw model question dicts into {question, options[4], correctIndex[, topic]}, dropping unusable and duplicate ones."""
+    cleaned: list[dict] = []
+    seen: set[bytes] = set()
+    for q in items:
+        if not isinstance(q, dict):
+            continue
+        question = (
+            str(
+                q.get("question")
+                or q.get("prompt")
+                or q.get("q")
+                or ""
+            )
+        ).strip()
+        opts = q.get("options") or q.get("choices") or q.get("answers") or []
+        if not isinstance(opts, list):
+            opts = []
+        options = [str(o).strip() for o in opts if str(o).strip()]
+        if len(options) >= 4:
+            options = options[:4]
+        elif len(options) == 3:
+            options.append("None of the above")
+        else:
+            continue
+        opt_index = _option_index(options)
+        ci = q.get("correctIndex")
+        if not isinstance(ci, int):
+            ci = (
+                q.get("answerIndex")
+                if isinstance(q.get("answerIndex"), int)
+                else to_index_from_answer(q.get("answer"), options, opt_index)
+            )
+        if not isinstance(ci, int):
+            ci = to_index_from_answer(q.get("correct"), options, opt_index)
+        if not isinstance(ci, int) or not (0 <= ci <= 3):
+            ci = to_index_from_answer(q.get("correctOption"), options, opt_index)
+        if not isinstance(ci, int) or not (0 <= ci <= 3):
+            continue
+        if not question or any(not o for o in options):
+            continue
+        key = _question_key(question)
+        if key in seen:
+            continue
+        seen.add(key)
+        item = {
+            "question": sanitize_katex(question),
+            "options": [_sanitize_option(o) for o in options],
+            "correctIndex": ci,
+        }
+        if with_topic:
+            topic_val = q.get("topic")
+            topic_str = None
+            if topic_val is not None:
+                try:
+                    topic_str = str(topic_val).strip() or None
+                except Exception:
+                    topic_str = None
+            item["topic"] = topic_str
+        cleaned.append(item)
+        if len(cleaned) >= count:
+            break
+    return cleaned
+
+
+# Questions requested per Gemini call. Output time grows with generated tokens,
+# so large quizzes are split into batches that are generated in parallel.
+QUIZ_BATCH_SIZE = int(os.getenv("QUIZ_BATCH_SIZE", "16"))
+# Extra rounds used to top a quiz back up when duplicates or short batches
+# leave it below the requested count.
+QUIZ_REFILL_ROUNDS = int(os.getenv("QUIZ_REFILL_ROUNDS", "2"))
+
+
+def _quiz_batch_guidance(index: int, total: int, topics: list[str] | None) -> str:
+    """Prompt note steering batch index (of total) to its own share of the material."""
+    if total <= 1:
+        return ""
+    safe_topics = sorted({str(t).strip() for t in (topics or []) if str(t).strip()})
+    share = safe_topics[index::total]
+    if share:
+        return (
+            f"\n\nBATCH {index + 1} OF {total}: other batches cover the remaining topics, "
+            "so write these questions about: " + ", ".join(share) + "."
+        )
+    return (
+        f"\n\nBATCH {index + 1} OF {total}: other batches cover the rest of the SUMMARY. "
+        f"Divide the SUMMARY into {total} consecutive parts of similar length and draw these questions from part {index + 1} only."
+    )
+
+
+def _avoid_questions_note(questions: list[str], limit: int = 40) -> str:
+    """Prompt note listing question stems already in the quiz, so a refill doesn't repeat them."""
+    stems: list[str] = []
+    for q in questions[-limit:]:
+        q = re.sub(r"\s+", " ", q).strip()
+        if q:
+            stems.append("- " + (q[:157] + "..." if len(q) > 160 else q))
+    if not stems:
+        return ""
+    return (
+        "\n\nAVOID REPEATS: the quiz already has these questions; do NOT repeat or rephrase them:\n"
+        + "\n".join(stems)
+    )
 
 
 def generate_quiz_with_gemini(
@@ -645,8 +1851,82 @@ def generate_quiz_with_gemini(
     - topics: optional list of topic strings that questions should be assigned to.
     - topic_stats: optional mapping { topic: [avg_difficulty (0-1), existing_count] } describing
       how hard questions for that topic currently are and how many already exist.
+
+    Large counts are split into QUIZ_BATCH_SIZE batches, each steered to its own
+    topics (or part of the summary). If duplicates across batches leave the quiz
+    short, up to QUIZ_REFILL_ROUNDS more rounds request the difference while
+    listing the questions already generated.
     """
+    merged: list[dict] = []
+    seen: set[bytes] = set()
+    for _ in range(1 + max(0, QUIZ_REFILL_ROUNDS)):
+        need = count - len(merged)
+        if need <= 0:
+            break
+        avoid = _avoid_questions_note([q["question"] for q in merged])
+        try:
+            generated = _generate_quiz_batches(summary, need, topics, topic_stats, avoid)
+        except Exception:
+            if not merged:
+                raise
+            break
+        before = len(merged)
+        # Batches are generated independently, so drop questions another batch already produced.
+        for q in generated:
+            key = _question_key(q["question"])
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(q)
+        if len(merged) == before:
+            break
+    return merged[:count]
+
+
+def _generate_quiz_batches(
+    summary: str,
+    count: int,
+    topics: list[str] | None,
+    topic_stats: dict[str, list[float | int]] | None,
+    avoid: str = "",
+) -> list[dict]:
+    """Run the QUIZ_BATCH_SIZE batches for count questions concurrently; raise only if all fail."""
+    batch = max(1, QUIZ_BATCH_SIZE)
+    if count <= batch:
+        return _generate_quiz_batch(summary, count, topics, topic_stats, avoid)
+    sizes = [batch] * (count // batch) + ([count % batch] if count % batch else [])
+    with ThreadPoolExecutor(max_workers=max(1, min(GEMINI_MAX_CONCURRENCY, len(sizes)))) as ex:
+        futures = [
+            ex.submit(_generate_quiz_batch, summary, n, topics, topic_stats, _quiz_batch_guidance(i, len(sizes), topics) + avoid)
+            for i, n in enumerate(sizes)
+        ]
+    questions: list[dict] = []
+    ok = False
+    error: Exception | None = None
+    for fut in futures:
+        try:
+            questions.extend(fut.result())
+            ok = True
+        except Exception as e:
+            print(f"Quiz batch failed: {e}", flush=True)
+            error = e
+    # Only fail the whole round when every batch failed.
+    if not ok and error is not None:
+        raise error
+    return questions
+
+
+def _generate_quiz_batch(
+    summary: str,
+    count: int,
+    topics: list[str] | None = None,
+    topic_stats: dict[str, list[float | int]] | None = None,
+    guidance: str = "",
+) -> list[dict]:
+    """Generate up to count quiz questions with a single Gemini request (plus one retry).
 
+    guidance is extra prompt text (batch focus, questions to avoid) placed before the SUMMARY.
+    """
     topics_desc = ""
     if topics:
         safe_topics = [str(t).strip() for t in topics if str(t).strip()]
@@ -707,10 +1987,11 @@ def generate_quiz_with_gemini(
         "Do not include prose outside of JSON."
         + topics_desc
         + stats_desc
+        + guidance
         + "\n\nSUMMARY:\n" + summary
     )
 
-    resp = gemini_client.models.generate_content(
+    resp = gemini_generate(
         model="gemini-2.5-flash-lite",
         contents=user_prompt,
         config={
@@ -741,58 +2022,7 @@ def generate_quiz_with_gemini(
     raw = (getattr(resp, "text", None) or "").strip()
     data = parse_json_lenient(raw or "{}")
     items = data if isinstance(data, list) else (data.get("items") if isinstance(data, dict) else [])
-    cleaned: list[dict] = []
-    for q in items:
-        if not isinstance(q, dict):
-            continue
-        question = (
-            str(
-                q.get("question")
-                or q.get("prompt")
-                or q.get("q")
-                or ""
-            )
-        ).strip()
-        opts = q.get("options") or q.get("choices") or q.get("answers") or []
-        if not isinstance(opts, list):
-            opts = []
-        options = [str(o).strip() for o in opts if str(o).strip()]
-        if len(options) >= 4:
-            options = options[:4]
-        elif len(options) == 3:
-            options.append("None of the above")
-        else:
-            continue
-        ci = q.get("correctIndex")
-        if not isinstance(ci, int):
-            ci = (
-                q.get("answerIndex")
-                if isinstance(q.get("answerIndex"), int)
-                else to_index_from_answer(q.get("answer"), options)
-            )
-        if not isinstance(ci, int):
-            ci = to_index_from_answer(q.get("correct"), options)
-        if not isinstance(ci, int) or not (0 <= ci <= 3):
-            ci = to_index_from_answer(q.get("correctOption"), options)
-        if not isinstance(ci, int) or not (0 <= ci <= 3):
-            continue
-        if not question or any(not o for o in options):
-            continue
-        topic_val = q.get("topic")
-        topic_str = None
-        if topic_val is not None:
-            try:
-                topic_str = str(topic_val).strip() or None
-            except Exception:
-                topic_str = None
-        cleaned.append({
-            "question": sanitize_katex(question),
-            "options": [sanitize_katex(o) for o in options],
-            "correctIndex": ci,
-            "topic": topic_str,
-        })
-        if len(cleaned) >= count:
-            break
+    cleaned = _normalize_questions(items or [], count)
     if not cleaned:
         retry_prompt = (
             "Create a multiple-choice quiz as JSON only. "
@@ -804,10 +2034,12 @@ def generate_quiz_with_gemini(
             "\nDIFFICULTY RUBRIC (D in [0,1]): 0.2 recall, 0.4 single-step, 0.6 multi-step with subtle distractor, 0.8 novel/integrated, 1.0 multi-step + traps.\n"
             "NOVELTY: Do NOT rephrase prior questions; change scenario, variables, constraints, and structure.\n"
             "VARIETY: Mix conceptual/computational/edge-cases; avoid repeating templates. Distractors must be plausible misconceptions.\n"
-            "Do not include prose outside of JSON.\n\nSUMMARY:\n" + summary
+            "Do not include prose outside of JSON."
+            + guidance
+            + "\n\nSUMMARY:\n" + summary
         )
         try:
-            retry_resp = gemini_client.models.generate_content(
+            retry_resp = gemini_generate(
                 model="gemini-2.5-flash-lite",
                 contents=retry_prompt,
                 config={
@@ -842,44 +2074,7 @@ def generate_quiz_with_gemini(
                     items = data.get("questions") or []
             elif isinstance(data, list):
                 items = data
-            for q in items:
-                if not isinstance(q, dict):
-                    continue
-                question = (
-                    str(q.get("question") or q.get("prompt") or q.get("q") or "")
-                ).strip()
-                opts = q.get("options") or q.get("choices") or q.get("answers") or []
-                if not isinstance(opts, list):
-                    opts = []
-                options = [str(o).strip() for o in opts if str(o).strip()]
-                if len(options) >= 4:
-                    options = options[:4]
-                elif len(options) == 3:
-                    options.append("None of the above")
-                else:
-                    continue
-                ci = q.get("correctIndex")
-                if not isinstance(ci, int):
-                    ci = (
-                        q.get("answerIndex")
-                        if isinstance(q.get("answerIndex"), int)
-                        else to_index_from_answer(q.get("answer"), options)
-                    )
-                if not isinstance(ci, int):
-                    ci = to_index_from_answer(q.get("correct"), options)
-                if not isinstance(ci, int) or not (0 <= ci <= 3):
-                    ci = to_index_from_answer(q.get("correctOption"), options)
-                if not isinstance(ci, int) or not (0 <= ci <= 3):
-                    continue
-                if not question or any(not o for o in options):
-                    continue
-                cleaned.append({
-                    "question": sanitize_katex(question),
-                    "options": [sanitize_katex(o) for o in options],
-                    "correctIndex": ci,
-                })
-                if len(cleaned) >= count:
-                    break
+            cleaned = _normalize_questions(items, count, with_topic=False)
         except Exception:
             pass
     return cleaned
@@ -902,7 +2097,7 @@ def generate_study_guide(text: str) -> str:
     )
 
     try:
-        resp = gemini_client.models.generate_content(
+        resp = gemini_generate(
             model="gemini-2.5-flash-lite",
             contents=prompt,
         )
@@ -918,85 +2113,173 @@ def generate_study_guide(text: str) -> str:
 
 def estimate_flashcard_count(text: str) -> int:
     """Heuristic to pick number of flashcards proportional to input size."""
-    t = estimate_tokens(text or "")
-    if t <= 0:
-        return 10
-    # Roughly 1 card per ~80 tokens, clamp to [10, 80]
-    return max(10, min(80, t // 50))
+    # Roughly 1 card per ~50 tokens, clamp to [10, 80]. estimate_tokens is
+    # never below 1, so empty text lands on the lower clamp.
+    return max(10, min(80, estimate_tokens(text or "") // 50))
+
+# Static parts of the flashcard request, built once; only the count and content vary per call.
+_FLASHCARD_PROMPT_RULES = (
+    "Each item must be an object with 'question' and 'answer' strings. "
+    "Keep answers brief and simple: aim for 1–2 short sentences and <= 200 characters. Avoid long derivations or full proofs; provide the key idea or formula only. "
+    "If math is involved, write LaTeX delimited by $...$ (inline) or $$...$$ (block). "
+    "When writing math, use KaTeX/LaTeX syntax for exponents, square roots, fractions, summations, and Greek letters (e.g., x^{2}, \\sqrt{...}, \\frac{...}{...}, \\sum, \\alpha). Do not use the caret '^' for exponents, plain 'sqrt', ASCII fractions, or plain Greek names. "
+    "For inequalities, use the literal '>' and '<' characters, not HTML entities like &gt; or &lt;. "
+    "Do NOT copy or reword examples, data, names, or numbers from the SUMMARY. "
+    "If chemistry is involved, use mhchem syntax like \\ce{H2O}, \\ce{Na+}. "
+    "Do not include citations, references, or meta commentary.\n\nCONTENT:\n"
+)
+_FLASHCARD_ITEM_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "question": {"type": "string"},
+        "answer": {"type": "string"},
+    },
+    "required": ["question", "answer"],
+}
+
+
+def _flashcards_request(text: str, count: int) -> dict:
+    """generate_content arguments for a flashcard request."""
+    prompt = "".join((
+        "Generate flashcards as a JSON array only (no prose, no markdown). ",
+        f"Return exactly {count} items. ",
+        _FLASHCARD_PROMPT_RULES,
+        text or "",
+    ))
+    return {
+        "model": "gemini-2.5-flash-lite",
+        "contents": prompt,
+        "config": {
+            "response_mime_type": "application/json",
+            "response_schema": {
+                "type": "array",
+                "minItems": max(1, min(count, 80)),
+                "maxItems": count,
+                "items": _FLASHCARD_ITEM_SCHEMA,
+            },
+        },
+    }
 
-def generate_flashcards_with_gemini(text: str, count: int) -> list[dict]:
-    """Ask Gemini for JSON list of {question, answer} pairs.
-    Ensures valid structure and trims to requested count.
+
+def _valid_flashcards(items):
+    """Yield sanitized {question, answer} cards from model items, skipping unusable ones."""
+    for it in items:
+        if not isinstance(it, dict):
+            continue
+        q = sanitize_katex(str(it.get("question") or "").strip())
+        a = sanitize_katex(str(it.get("answer") or "").strip())
+        if q and a:
+            yield {"question": q, "answer": a}
+
+
+def iter_flashcards_with_gemini(text: str, count: int):
+    """Yield up to count flashcards as Gemini streams them.
+
+    Cards are parsed as each array element completes, and the stream is closed
+    once count cards have been produced. If the streamed text is not a plain
+    array it is parsed leniently at the end; if streaming fails before any
+    card arrives, a regular request is made instead.
     """
+    produced = 0
+    pieces: list[str] = []
+    raw = None
 
-    prompt = (
-        "Generate flashcards as a JSON array only (no prose, no markdown). "
-        f"Return exactly {count} items. Each item must be an object with 'question' and 'answer' strings. "
-        "Keep answers brief and simple: aim for 1–2 short sentences and <= 200 characters. Avoid long derivations or full proofs; provide the key idea or formula only. "
-        "If math is involved, write LaTeX delimited by $...$ (inline) or $$...$$ (block). "
-        "When writing math, use KaTeX/LaTeX syntax for exponents, square roots, fractions, summations, and Greek letters (e.g., x^{2}, \\sqrt{...}, \\frac{...}{...}, \\sum, \\alpha). Do not use the caret '^' for exponents, plain 'sqrt', ASCII fractions, or plain Greek names. "
-        "For inequalities, use the literal '>' and '<' characters, not HTML entities like &gt; or &lt;. "
-        "Do NOT copy or reword examples, data, names, or numbers from the SUMMARY. "
-        "If chemistry is involved, use mhchem syntax like \\ce{H2O}, \\ce{Na+}. "
-        "Do not include citations, references, or meta commentary.\n\nCONTENT:\n" + (text or "")
-    )
+    def recorded(stream):
+        for piece in stream:
+            pieces.append(piece)
+            yield piece
 
     try:
-        resp = gemini_client.models.generate_content(
-            model="gemini-2.5-flash-lite",
-            contents=prompt,
-            config={
-                "response_mime_type": "application/json",
-                "response_schema": {
-                    "type": "array",
-                    "minItems": max(1, min(count, 80)),
-                    "maxItems": count,
-                    "items": {
-                        "type": "object",
-                        "properties": {
-                            "question": {"type": "string"},
-                            "answer": {"type": "string"},
-                        },
-                        "required": ["question", "answer"],
-                    },
-                },
-            },
-        )
-        raw = (getattr(resp, "text", None) or "").strip()
+        stream = gemini_stream_text(**_flashcards_request(text, count))
         try:
-            data = json.loads(raw)
-        except Exception:
-            data = parse_json_lenient(raw or "[]")
-        items = data if isinstance(data, list) else (data.get("items") if isinstance(data, dict) else [])
-        flashcards: list[dict] = []
-        if isinstance(items, list):
-            for it in items:
-                if not isinstance(it, dict):
-                    continue
-                q = sanitize_katex(str(it.get("question") or "").strip())
-                a = sanitize_katex(str(it.get("answer") or "").strip())
-                if not q or not a:
-                    continue
-                flashcards.append({"question": q, "answer": a})
-                if len(flashcards) >= count:
-                    break
-        return flashcards
+            for card in islice(_valid_flashcards(iter_json_array(recorded(stream))), count):
+                yield card
+                produced += 1
+            if produced >= count:
+                return
+            # Non-array output stops the incremental parser; keep the rest for the lenient parse.
+            pieces.extend(stream)
+            raw = "".join(pieces)
+        finally:
+            stream.close()
+    except Exception as e:
+        if produced:
+            print(f"Flashcard stream ended early: {e}", flush=True)
+            return
+        print(f"Flashcard stream failed, retrying without streaming: {e}", flush=True)
+    if produced:
+        return
+    if raw is None:
+        resp = gemini_generate(**_flashcards_request(text, count))
+        raw = getattr(resp, "text", None) or ""
+    raw = raw.strip()
+    try:
+        data = orjson.loads(raw or "[]")
+    except Exception:
+        # The JSON mime type should rule this out; a truncated response still can.
+        print(f"Flashcard response was not valid JSON ({len(raw)} chars); parsing leniently", flush=True)
+        data = parse_json_lenient(raw)
+    items = data if isinstance(data, list) else (data.get("items") if isinstance(data, dict) else [])
+    if isinstance(items, list):
+        yield from islice(_valid_flashcards(items), count)
+
+
+def generate_flashcards_with_gemini(text: str, count: int) -> list[dict]:
+    """Ask Gemini for JSON list of {question, answer} pairs.
+    Ensures valid structure and trims to requested count.
+    """
+    try:
+        return list(iter_flashcards_with_gemini(text, count))
     except Exception as e:
         print(e, flush=True)
         return []
 
 
+def conditional_json(**payload):
+    """jsonify with an ETag of the body, answering a matching If-None-Match with 304.
+
+    Cache-Control: no-cache makes the browser revalidate every time, so data is
+    never stale but unchanged responses come back without a body.
+    """
+    resp = jsonify(**payload)
+    resp.add_etag()
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp.make_conditional(request)
+
+
 # ============================================================================
 # ROUTES - AUTHENTICATION
 # ============================================================================
 
+# Verified Firebase ID tokens, keyed by a digest of the token. Entries never
+# outlive the token's own exp claim.
+FIREBASE_TOKEN_CACHE_TTL = int(os.getenv("FIREBASE_TOKEN_CACHE_TTL", "300"))
+_firebase_token_cache = TTLCache(maxsize=10_000, ttl=FIREBASE_TOKEN_CACHE_TTL)
+
+
+def verify_firebase_token(token: str) -> dict:
+    """verify_id_token with an in-process cache, skipping signature checks for recently seen tokens."""
+    key = hashlib.blake2b(str(token).encode("utf-8"), digest_size=16).digest()
+    decoded = _firebase_token_cache.get(key)
+    if decoded is not None:
+        return decoded
+    decoded = firebase_auth.verify_id_token(token)
+    try:
+        remaining = float(decoded.get("exp", 0)) - time.time()
+    except Exception:
+        remaining = 0.0
+    if remaining > 0:
+        _firebase_token_cache.set(key, decoded, ttl=min(FIREBASE_TOKEN_CACHE_TTL, remaining))
+    return decoded
+
+
 @app.route("/api/firebase-login", methods=["POST"])
 def firebase_login():
     """Firebase login verification (for Google sign-in)."""
     data = request.get_json()
     token = data.get("idToken")
     try:
-        decoded_token = firebase_auth.verify_id_token(token)
+        decoded_token = verify_firebase_token(token)
         user_email = decoded_token.get("email")
         user_name = decoded_token.get("name", "NoName")
         if not user_email:
@@ -1114,80 +2397,145 @@ def signup():
 # ROUTES - STUDY PAGE
 # ============================================================================
 
-@app.get("/api/recent_sets")
-def list_recent_sets():
-    """Return recent study sets and study guides for the current user ordered by created_at DESC.
-    Output items: [{ type: 'study_set'|'study_guide', id, name?, title?, created_at }]
-    """
-    user_id = session.get("user_id")
-    if not user_id:
-        return jsonify(error="unauthorized"), 401
-    conn = get_connection()
-    if not conn:
-        return jsonify(error="Database connection error"), 500
-    try:
-        cur = conn.cursor()
-        # study sets
-        try:
-            cur.execute(
-                "SELECT id, name, created_at FROM study_sets WHERE user_id = %s",
-                (user_id,),
-            )
-            ss_rows = cur.fetchall()
-        except Exception:
-            ss_rows = []
-        # study guides
-        try:
-            cur.execute(
-                "SELECT id, title, created_at FROM study_guides WHERE user_id = %s",
-                (user_id,),
-            )
-            sg_rows = cur.fetchall()
-        except Exception:
-            sg_rows = []
-        # notes
-        try:
-            cur.execute(
-                "SELECT id, title, created_at FROM notes WHERE user_id = %s",
-                (user_id,),
-            )
-            note_rows = cur.fetchall()
-        except Exception:
-            note_rows = []
-        # summaries
-        try:
-            cur.execute(
-                "SELECT id, title, created_at FROM summaries WHERE user_id = %s",
-                (user_id,),
-            )
-            sum_rows = cur.fetchall()
-        except Exception:
-            sum_rows = []
+# Recent items across the user's study content: one UNION ALL branch per table,
+# each yielding (type, id, label, created_at).
+_RECENT_BRANCHES = {
+    "study_sets": "SELECT 'study_set' AS type, id, name AS label, created_at FROM study_sets WHERE user_id = %s",
+    "study_guides": "SELECT 'study_guide', id, title, created_at FROM study_guides WHERE user_id = %s",
+    "notes": "SELECT 'note', id, title, created_at FROM notes WHERE user_id = %s",
+    "summaries": "SELECT 'summary', id, title, created_at FROM summaries WHERE user_id = %s",
+}
+
+# Table names in the public schema, re-read every few minutes so a table
+# created after startup is picked up.
+_public_tables_cache = TTLCache(maxsize=1, ttl=300)
+
+
+def _public_tables(cur) -> frozenset[str]:
+    """Names of the tables that exist in the public schema."""
+    tables = _public_tables_cache.get("public")
+    if tables is None:
+        cur.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = 'public'")
+        tables = frozenset(r[0] for r in cur.fetchall())
+        _public_tables_cache.set("public", tables)
+    return tables
+
+
+def _recent_items_query(cur, tables: tuple[str, ...], limit: int | None = None) -> tuple[str, int] | None:
+    """UNION ALL over the given tables that exist, newest first, with its parameter count."""
+    present = _public_tables(cur)
+    branches = [_RECENT_BRANCHES[t] for t in tables if t in present]
+    if not branches:
+        return None
+    sql = " UNION ALL ".join(branches) + " ORDER BY created_at DESC NULLS LAST"
+    if limit is not None:
+        sql += f" LIMIT {int(limit)}"
+    return sql, len(branches)
+
+
+def _recent_item(row) -> dict:
+    """Shape a (type, id, label, created_at) row; study sets are labelled by name, everything else by title."""
+    kind, item_id, label, created_at = row
+    return {
+        "type": kind,
+        "id": item_id,
+        ("name" if kind == "study_set" else "title"): label,
+        "created_at": created_at.isoformat() if created_at else None,
+    }
+
+
+@app.get("/api/recent_sets")
+def list_recent_sets():
+    """Return recent study sets and study guides for the current user ordered by created_at DESC.
+    Output items: [{ type: 'study_set'|'study_guide', id, name?, title?, created_at }]
+    """
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify(error="unauthorized"), 401
+    conn = get_connection()
+    if not conn:
+        return jsonify(error="Database connection error"), 500
+    try:
+        cur = conn.cursor()
+        # One round trip: Postgres merges the per-table rows and keeps only the newest five.
+        # Tables that don't exist are left out of the query instead of failing it.
+        query = _recent_items_query(cur, ("study_sets", "study_guides", "notes", "summaries"), limit=5)
+        rows = []
+        if query:
+            sql, n = query
+            cur.execute(sql, (user_id,) * n)
+            rows = cur.fetchall()
         cur.close()
-        items = (
-            [
-                {"type": "study_set", "id": r[0], "name": r[1], "created_at": (r[2].isoformat() if r[2] else None)}
-                for r in ss_rows
-            ]
-            + [
-                {"type": "study_guide", "id": r[0], "title": r[1], "created_at": (r[2].isoformat() if r[2] else None)}
-                for r in sg_rows
-            ]
-            + [
-                {"type": "note", "id": r[0], "title": r[1], "created_at": (r[2].isoformat() if r[2] else None)}
-                for r in note_rows
-            ]
-            + [
-                {"type": "summary", "id": r[0], "title": r[1], "created_at": (r[2].isoformat() if r[2] else None)}
-                for r in sum_rows
-            ]
-        )
-        # Sort by created_at DESC, nulls last, and limit to top 5
-        items.sort(key=lambda x: (x.get("created_at") is None, x.get("created_at") or ""), reverse=True)
-        items = items[:5]
-        return jsonify(items=items), 200
+        return conditional_json(items=[_recent_item(r) for r in rows])
     except Exception as e:
         return jsonify(error=str(e)), 500
+    finally:
+        conn.close()
+
+
+# Topics scoring below this mastery are surfaced as "low mastery".
+LOW_MASTERY_THRESHOLD = 3.5
+
+
+def _course_topic_scores(cur, user_id, course_id: int) -> list[dict] | None:
+    """Per-topic mastery scores for a course owned by user_id, or None if it isn't theirs.
+
+    Questions from quizzes in this course and from quizzes with no course count
+    towards a topic when their topic matches its title (case-insensitive).
+    """
+    # Ensure course belongs to current user
+    cur.execute(
+        "SELECT id FROM courses WHERE id = %s AND created_by = %s",
+        (course_id, user_id),
+    )
+    if not cur.fetchone():
+        return None
+    cur.execute(
+        """
+        SELECT
+          t.id,
+          t.title,
+          COALESCE(
+            AVG(
+              CASE
+                WHEN qq.max_streak < 3
+                     OR COALESCE(qq.confidence, 0) < 3.5
+                THEN COALESCE(qq.mastery, 0)
+                ELSE 1.0
+              END
+            ),
+            0
+          ) AS topic_score
+        FROM topics t
+        LEFT JOIN quizzes q
+          ON q.created_by = %s
+         AND (q.course_id = t.course_id OR q.course_id IS NULL)
+        LEFT JOIN quiz_questions qq
+          ON qq.quiz_id = q.id
+         AND lower(TRIM(COALESCE(qq.topic, ''))) = lower(TRIM(t.title))
+         AND qq.topic IS NOT NULL
+         AND qq.topic != ''
+        WHERE t.course_id = %s
+        GROUP BY t.id, t.title
+        ORDER BY t.id
+        """,
+        (user_id, course_id),
+    )
+    return [
+        {"topic_id": tid, "title": title, "score": float(topic_score) if topic_score is not None else 0.0}
+        for tid, title, topic_score in cur.fetchall()
+    ]
+
+
+def _course_id_arg():
+    """Parse the course_id query param; returns (course_id, None) or (None, error response)."""
+    raw_course_id = request.args.get("course_id")
+    if raw_course_id is None:
+        return None, (jsonify(error="course_id required"), 400)
+    try:
+        return int(raw_course_id), None
+    except Exception:
+        return None, (jsonify(error="course_id must be an integer"), 400)
 
 
 @app.get("/api/course_progress")
@@ -1196,6 +2544,8 @@ def course_progress():
 
     Query params:
       - course_id: integer id of the course
+      - include_low_mastery: "true" to also return low_mastery, the topics scoring
+        below 3.5 (what /api/course_low_mastery_topics returns), from the same query
 
     For each topic in this course, we look at quiz_questions that belong to quizzes
     for this course and current user, where quiz_questions.topic matches the topic title
@@ -1214,94 +2564,35 @@ def course_progress():
     user_id = session.get("user_id")
     if not user_id:
         return jsonify(error="unauthorized"), 401
+    course_id, error = _course_id_arg()
+    if error:
+        return error
 
+    conn = get_connection()
+    if not conn:
+        return jsonify(error="Database connection error"), 500
     try:
-        raw_course_id = request.args.get("course_id")
-        if raw_course_id is None:
-            return jsonify(error="course_id required"), 400
-        try:
-            course_id = int(raw_course_id)
-        except Exception:
-            return jsonify(error="course_id must be an integer"), 400
-
-        conn = get_connection()
-        if not conn:
-            return jsonify(error="Database connection error"), 500
-
         cur = conn.cursor()
-        # Ensure course belongs to current user
-        cur.execute(
-            "SELECT id FROM courses WHERE id = %s AND created_by = %s",
-            (course_id, user_id),
-        )
-        row = cur.fetchone()
-        if not row:
-            cur.close()
-            conn.close()
-            return jsonify(error="not found"), 404
-
-        # For each topic in this course, compute average question score.
-        # Include questions from quizzes in this course AND quizzes with no course (course_id IS NULL)
-        # when their topic matches the topic title.
-        cur.execute(
-            """
-            SELECT
-              t.id,
-              t.title,
-              COALESCE(
-                AVG(
-                  CASE
-                    WHEN qq.max_streak < 3
-                         OR COALESCE(qq.confidence, 0) < 3.5
-                    THEN COALESCE(qq.mastery, 0)
-                    ELSE 1.0
-                  END
-                ),
-                0
-              ) AS topic_score
-            FROM topics t
-            LEFT JOIN quizzes q
-              ON q.created_by = %s
-             AND (q.course_id = t.course_id OR q.course_id IS NULL)
-            LEFT JOIN quiz_questions qq
-              ON qq.quiz_id = q.id
-             AND lower(TRIM(COALESCE(qq.topic, ''))) = lower(TRIM(t.title))
-             AND qq.topic IS NOT NULL
-             AND qq.topic != ''
-            WHERE t.course_id = %s
-            GROUP BY t.id, t.title
-            ORDER BY t.id
-            """,
-            (user_id, course_id),
-        )
-        rows = cur.fetchall()
+        per_topic = _course_topic_scores(cur, user_id, course_id)
         cur.close()
-        conn.close()
-
-        per_topic = []
-        total_score = 0.0
-        topic_count = 0
-        for tid, title, topic_score in rows:
-            score = float(topic_score) if topic_score is not None else 0.0
-            per_topic.append({"topic_id": tid, "title": title, "score": score})
-            total_score += score
-            topic_count += 1
+        if per_topic is None:
+            return jsonify(error="not found"), 404
 
         overall_mastery = 0.0
         overall_percent = 0.0
-        if topic_count > 0:
-            overall_mastery = total_score / float(topic_count)
+        if per_topic:
+            overall_mastery = sum(t["score"] for t in per_topic) / float(len(per_topic))
             # mastery is 0-5; scale to 0-100
             overall_percent = max(0.0, min(100.0, (overall_mastery / 5.0) * 100.0))
 
-        return (
-            jsonify(
-                per_topic=per_topic,
-                overall_mastery=overall_mastery,
-                overall_percent=overall_percent,
-            ),
-            200,
-        )
+        payload = {
+            "per_topic": per_topic,
+            "overall_mastery": overall_mastery,
+            "overall_percent": overall_percent,
+        }
+        if request.args.get("include_low_mastery") == "true":
+            payload["low_mastery"] = [t for t in per_topic if t["score"] < LOW_MASTERY_THRESHOLD]
+        return conditional_json(**payload)
     except Exception as e:
         return jsonify(error=str(e)), 500
     finally:
@@ -1314,90 +2605,31 @@ def course_low_mastery_topics():
 
     Uses the same scoring rule and topic aggregation as /api/course_progress,
     but filters the per-topic list on the backend and only returns topics with
-    score < 3.5 for the current user and given course.
+    score < 3.5 for the current user and given course. Callers that also need
+    the overall progress can use /api/course_progress?include_low_mastery=true.
     """
     user_id = session.get("user_id")
     if not user_id:
         return jsonify(error="unauthorized"), 401
+    course_id, error = _course_id_arg()
+    if error:
+        return error
 
-    conn = None
+    conn = get_connection()
+    if not conn:
+        return jsonify(error="Database connection error"), 500
     try:
-        raw_course_id = request.args.get("course_id")
-        if raw_course_id is None:
-            return jsonify(error="course_id required"), 400
-        try:
-            course_id = int(raw_course_id)
-        except Exception:
-            return jsonify(error="course_id must be an integer"), 400
-
-        conn = get_connection()
-        if not conn:
-            return jsonify(error="Database connection error"), 500
-
         cur = conn.cursor()
-        # Ensure course belongs to current user
-        cur.execute(
-            "SELECT id FROM courses WHERE id = %s AND created_by = %s",
-            (course_id, user_id),
-        )
-        row = cur.fetchone()
-        if not row:
-            cur.close()
-            conn.close()
-            return jsonify(error="not found"), 404
-
-        # Reuse the same aggregation query as course_progress to compute
-        # per-topic scores for this course.
-        cur.execute(
-            """
-            SELECT
-              t.id,
-              t.title,
-              COALESCE(
-                AVG(
-                  CASE
-                    WHEN qq.max_streak < 3
-                         OR COALESCE(qq.confidence, 0) < 3.5
-                    THEN COALESCE(qq.mastery, 0)
-                    ELSE 1.0
-                  END
-                ),
-                0
-              ) AS topic_score
-            FROM topics t
-            LEFT JOIN quizzes q
-              ON q.created_by = %s
-             AND (q.course_id = t.course_id OR q.course_id IS NULL)
-            LEFT JOIN quiz_questions qq
-              ON qq.quiz_id = q.id
-             AND lower(TRIM(COALESCE(qq.topic, ''))) = lower(TRIM(t.title))
-             AND qq.topic IS NOT NULL
-             AND qq.topic != ''
-            WHERE t.course_id = %s
-            GROUP BY t.id, t.title
-            ORDER BY t.id
-            """,
-            (user_id, course_id),
-        )
-        rows = cur.fetchall()
+        per_topic = _course_topic_scores(cur, user_id, course_id)
         cur.close()
-        conn.close()
-
-        items = []
-        for tid, title, topic_score in rows:
-            score = float(topic_score) if topic_score is not None else 0.0
-            if score < 3.5:
-                items.append({"topic_id": tid, "title": title, "score": score})
-
+        if per_topic is None:
+            return jsonify(error="not found"), 404
+        items = [t for t in per_topic if t["score"] < LOW_MASTERY_THRESHOLD]
         return jsonify(items=items), 200
     except Exception as e:
         return jsonify(error=str(e)), 500
     finally:
-        try:
-            if conn is not None:
-                conn.close()
-        except Exception:
-            pass
+        conn.close()
 
 
 @app.get("/api/course_progress_all")
@@ -1469,13 +2701,10 @@ def course_progress_all():
             # mastery is 0-5; expose as 0-1 decimal for the client
             overall_percent = max(0.0, min(1.0, overall_mastery / 5.0))
 
-        return (
-            jsonify(
-                per_topic=per_topic,
-                overall_mastery=overall_mastery,
-                overall_percent=overall_percent,
-            ),
-            200,
+        return conditional_json(
+            per_topic=per_topic,
+            overall_mastery=overall_mastery,
+            overall_percent=overall_percent,
         )
     except Exception as e:
         return jsonify(error=str(e)), 500
@@ -1513,94 +2742,44 @@ def course_progress_by_course():
         return jsonify(error="Database connection error"), 500
     try:
         cur = conn.cursor()
-        # Pull raw per-question data only for quizzes that belong to this course.
+        # Score questions, average per topic, then average the topic scores, all in
+        # Postgres so only one number comes back.
         # Special case: course_id == 0 represents the 'no course' bucket (q.course_id IS NULL).
-        if course_id == 0:
-            cur.execute(
-                """
-                SELECT
-                  q.course_id,
-                  NULLIF(TRIM(COALESCE(qq.topic, '')), '') AS topic,
-                  qq.mastery,
-                  qq.max_streak,
-                  qq.confidence
-                FROM quizzes q
-                JOIN quiz_questions qq
-                  ON qq.quiz_id = q.id
-                WHERE q.created_by = %s
-                  AND q.course_id IS NULL
-                  AND NULLIF(TRIM(COALESCE(qq.topic, '')), '') IS NOT NULL
-                """,
-                (user_id,),
-            )
-        else:
-            cur.execute(
-                """
-                SELECT
-                  q.course_id,
-                  NULLIF(TRIM(COALESCE(qq.topic, '')), '') AS topic,
-                  qq.mastery,
-                  qq.max_streak,
-                  qq.confidence
-                FROM quizzes q
-                JOIN quiz_questions qq
-                  ON qq.quiz_id = q.id
-                WHERE q.created_by = %s
-                  AND q.course_id = %s
-                  AND NULLIF(TRIM(COALESCE(qq.topic, '')), '') IS NOT NULL
-                """,
-                (user_id, course_id),
+        course_filter = "q.course_id IS NULL" if course_id == 0 else "q.course_id = %s"
+        params = (user_id,) if course_id == 0 else (user_id, course_id)
+        cur.execute(
+            f"""
+            WITH topic_scores AS (
+              SELECT
+                NULLIF(TRIM(COALESCE(qq.topic, '')), '') AS topic,
+                AVG(
+                  CASE
+                    WHEN COALESCE(qq.max_streak, 0) < 3 OR COALESCE(qq.confidence, 0) < 3.5
+                      THEN COALESCE(qq.mastery, 0)
+                    ELSE 1.0
+                  END
+                ) AS score
+              FROM quizzes q
+              JOIN quiz_questions qq
+                ON qq.quiz_id = q.id
+              WHERE q.created_by = %s
+                AND {course_filter}
+                AND NULLIF(TRIM(COALESCE(qq.topic, '')), '') IS NOT NULL
+              GROUP BY 1
             )
-        rows = cur.fetchall()
-
-        # Build per-course, per-topic score lists in Python.
-        # course_topic_scores[cid][topic] = [per-question scores]
-        course_topic_scores: dict[object, dict[str, list[float]]] = {}
-        for cid, topic, mastery, max_streak, confidence in rows:
-            if (cid is None and course_id != 0) or topic is None:
-                continue
-            try:
-                m_val = float(mastery) if mastery is not None else 0.0
-            except Exception:
-                m_val = 0.0
-            try:
-                streak = int(max_streak) if max_streak is not None else 0
-            except Exception:
-                streak = 0
-            try:
-                conf = float(confidence) if confidence is not None else 0.0
-            except Exception:
-                conf = 0.0
-
-            if streak < 3 or conf < 3.5:
-                score = m_val  # use mastery 0-5
-            else:
-                score = 1.0
-
-            bucket = course_topic_scores.setdefault(cid, {})
-            lst = bucket.setdefault(str(topic), [])
-            lst.append(score)
-
-
-        # Now compute per-course mastery: average topic scores per course.
-
-        course_scores: dict[object, float] = {}
-        for cid, topics in course_topic_scores.items():
-            topic_scores: list[float] = []
-            for _, scores in topics.items():
-                if not scores:
-                    continue
-                topic_scores.append(sum(scores) / float(len(scores)))
-            if not topic_scores:
-                continue
-            course_scores[cid] = sum(topic_scores) / float(len(topic_scores))
+            SELECT AVG(score)::float8 FROM topic_scores
+            """,
+            params,
+        )
+        row = cur.fetchone()
+        course_mastery = row[0] if row else None
 
         # Fetch the name for this specific course_id
         name = ""
         if course_id == 0:
             # Synthetic 'No course' bucket
             name = "No course"
-        elif course_scores:
+        elif course_mastery is not None:
             cur.execute(
                 "SELECT name FROM courses WHERE created_by = %s AND id = %s",
                 (user_id, course_id),
@@ -1608,14 +2787,8 @@ def course_progress_by_course():
             for s in cur.fetchall():
                 name = s[0]
 
-        # Build a single result entry for this course (if we have any data).
-        key_id = None if course_id == 0 else course_id
-        if key_id not in course_scores:
-            # No questions/topics yet for this course -> 0 progress
-            overall_mastery = 0.0
-        else:
-            overall_mastery = course_scores[key_id]
-
+        # No questions/topics yet for this course -> 0 progress
+        overall_mastery = course_mastery if course_mastery is not None else 0.0
 
         overall_percent = max(0.0, min(1.0, overall_mastery / 5.0))
 
@@ -1647,34 +2820,14 @@ def list_recent_dashboard_sets():
         return jsonify(error="Database connection error"), 500
     try:
         cur = conn.cursor()
-        # study sets
-        cur.execute(
-            "SELECT id, name, created_at FROM study_sets WHERE user_id = %s",
-            (user_id,),
-        )
-        ss_rows = cur.fetchall()
-        # study guides
-        try:
-            cur.execute(
-                "SELECT id, title, created_at FROM study_guides WHERE user_id = %s",
-                (user_id,),
-            )
-            sg_rows = cur.fetchall()
-        except Exception:
-            sg_rows = []
+        query = _recent_items_query(cur, ("study_sets", "study_guides"))
+        rows = []
+        if query:
+            sql, n = query
+            cur.execute(sql, (user_id,) * n)
+            rows = cur.fetchall()
         cur.close()
-        items = (
-            [
-                {"type": "study_set", "id": r[0], "name": r[1], "created_at": (r[2].isoformat() if r[2] else None)}
-                for r in ss_rows
-            ]
-            + [
-                {"type": "study_guide", "id": r[0], "title": r[1], "created_at": (r[2].isoformat() if r[2] else None)}
-                for r in sg_rows
-            ]
-        )
-        items.sort(key=lambda x: (x.get("created_at") is None, x.get("created_at") or ""), reverse=True)
-        return jsonify(items=items), 200
+        return conditional_json(items=[_recent_item(r) for r in rows])
     except Exception as e:
         return jsonify(error=str(e)), 500
     finally:
@@ -1708,6 +2861,7 @@ def create_course():
         new_id = cur.fetchone()[0]
         conn.commit()
         cur.close()
+        bump_list_cache("courses")
         return jsonify(course={"id": new_id, "name": name, "description": description, "created_by": user_id}), 201
     except Exception as e:
         conn.rollback()
@@ -1723,6 +2877,10 @@ def list_courses():
         user_id = session.get("user_id")
         if not user_id:
             return jsonify(error="unauthorized"), 401
+        cache_key = list_cache_key("courses")
+        items = _list_cache.get(cache_key)
+        if items is not None:
+            return conditional_json(courses=items)
         conn = get_connection()
         if not conn:
             return jsonify(error="Database connection error"), 500
@@ -1738,7 +2896,8 @@ def list_courses():
             {"id": r[0], "name": r[1], "description": r[2], "created_by": r[3]}
             for r in rows
         ]
-        return jsonify(courses=items), 200
+        _list_cache.set(cache_key, items)
+        return conditional_json(courses=items)
     except Exception as e:
         return jsonify(error=str(e)), 500
 
@@ -1763,12 +2922,14 @@ def update_study_set(sid: int):
         return jsonify(error="Database connection error"), 500
     try:
         cur = conn.cursor()
-        cur.execute("SELECT id FROM study_sets WHERE id = %s AND user_id = %s", (sid, user_id))
-        row = cur.fetchone()
-        if not row:
+        cur.execute(
+            "UPDATE study_sets SET name = %s WHERE id = %s AND user_id = %s RETURNING id",
+            (new_name, sid, user_id),
+        )
+        if cur.fetchone() is None:
             return jsonify(error="not found"), 404
-        cur.execute("UPDATE study_sets SET name = %s WHERE id = %s", (new_name, sid))
         conn.commit()
+        bump_list_cache("study_sets")
         cur.close()
         return jsonify(id=sid, name=new_name), 200
     except Exception as e:
@@ -1812,10 +2973,11 @@ def create_study_set():
             VALUES (%s, %s, %s, %s)
             RETURNING id, created_at
             """,
-            (name, course_id, user_id, json.dumps(norm_cards)),
+            (name, course_id, user_id, orjson.dumps(norm_cards).decode()),
         )
         sid, created_at = cur.fetchone()
         conn.commit()
+        bump_list_cache("study_sets")
         cur.close()
         return jsonify(id=sid, name=name, course_id=course_id, created_at=(created_at.isoformat() if created_at else None), cards=norm_cards), 201
     except Exception as e:
@@ -1827,39 +2989,42 @@ def create_study_set():
 
 @app.get("/api/study_sets")
 def list_study_sets():
-    """List study sets for the current user. Optional query: course_id=..."""
+    """List study set metadata (card_count, no cards) for the current user. Optional query: course_id=..."""
     user_id = session.get("user_id")
     if not user_id:
         return jsonify(error="unauthorized"), 401
     course_id = request.args.get("course_id", type=int)
+    cache_key = list_cache_key("study_sets", course_id)
+    body = _list_cache.get(cache_key)
+    if body is not None:
+        return app.response_class(body, mimetype="application/json"), 200
     conn = get_connection()
     if not conn:
         return jsonify(error="Database connection error"), 500
     try:
         cur = conn.cursor()
+        # Postgres builds the JSON array itself; we only wrap it in {"items": ...}
+        sql = """
+            SELECT COALESCE(json_agg(json_build_object(
+                       'id', id,
+                       'name', name,
+                       'course_id', course_id,
+                       'created_at', created_at,
+                       'card_count', jsonb_array_length(COALESCE(cards, '[]'::jsonb))
+                   ) ORDER BY id), '[]'::json)::text
+            FROM study_sets
+            WHERE user_id = %s
+        """
+        params = [user_id]
         if course_id is not None:
-            cur.execute(
-                "SELECT id, name, course_id, created_at, cards FROM study_sets WHERE user_id = %s AND course_id = %s ORDER BY id ASC",
-                (user_id, course_id),
-            )
-        else:
-            cur.execute(
-                "SELECT id, name, course_id, created_at, cards FROM study_sets WHERE user_id = %s ORDER BY id ASC",
-                (user_id,),
-            )
-        rows = cur.fetchall()
+            sql += " AND course_id = %s"
+            params.append(course_id)
+        cur.execute(sql, params)
+        row = cur.fetchone()
         cur.close()
-        items = [
-            {
-                "id": r[0],
-                "name": r[1],
-                "course_id": r[2],
-                "created_at": (r[3].isoformat() if r[3] else None),
-                "cards": r[4] or [],
-            }
-            for r in rows
-        ]
-        return jsonify(items=items), 200
+        body = '{"items":' + ((row and row[0]) or "[]") + "}"
+        _list_cache.set(cache_key, body)
+        return app.response_class(body, mimetype="application/json"), 200
     except Exception as e:
         return jsonify(error=str(e)), 500
     finally:
@@ -1882,23 +3047,26 @@ def add_card_to_study_set(sid: int):
         return jsonify(error="Database connection error"), 500
     try:
         cur = conn.cursor()
-        cur.execute("SELECT id, cards FROM study_sets WHERE id = %s AND user_id = %s", (sid, user_id))
+        payload = {"question": question, "answer": answer}
+        # Append in Postgres so the existing cards never leave the database.
+        # Also refresh created_at to bubble this set to recent
+        cur.execute(
+            """
+            UPDATE study_sets
+            SET cards = (CASE WHEN jsonb_typeof(cards) = 'array' THEN cards ELSE '[]'::jsonb END) || %s::jsonb,
+                created_at = NOW()
+            WHERE id = %s AND user_id = %s
+            RETURNING jsonb_array_length(cards)
+            """,
+            (orjson.dumps([payload]).decode(), sid, user_id),
+        )
         row = cur.fetchone()
         if not row:
             return jsonify(error="not found"), 404
-        existing = row[1] or []
-        try:
-            if not isinstance(existing, list):
-                existing = []
-        except Exception:
-            existing = []
-        payload = {"question": question, "answer": answer}
-        existing.append(payload)
-        # Also refresh created_at to bubble this set to recent
-        cur.execute("UPDATE study_sets SET cards = %s, created_at = NOW() WHERE id = %s", (json.dumps(existing), sid))
         conn.commit()
+        bump_list_cache("study_sets")
         cur.close()
-        return jsonify(id=sid, added=payload, count=len(existing)), 200
+        return jsonify(id=sid, added=payload, count=row[0]), 200
     except Exception as e:
         conn.rollback()
         return jsonify(error=str(e)), 500
@@ -1917,22 +3085,26 @@ def delete_card_from_study_set(sid: int, card_index: int):
         return jsonify(error="Database connection error"), 500
     try:
         cur = conn.cursor()
-        cur.execute("SELECT id, cards FROM study_sets WHERE id = %s AND user_id = %s", (sid, user_id))
-        row = cur.fetchone()
-        if not row:
-            return jsonify(error="not found"), 404
-        existing = row[1] or []
-        try:
-            if not isinstance(existing, list):
-                existing = []
-        except Exception:
-            existing = []
-        if not (0 <= card_index < len(existing)):
+        # Remove the card in Postgres; only an in-range index on an array matches.
+        cur.execute(
+            """
+            UPDATE study_sets
+            SET cards = cards - %s::int
+            WHERE id = %s AND user_id = %s
+              AND jsonb_typeof(cards) = 'array'
+              AND %s < jsonb_array_length(cards)
+            RETURNING id
+            """,
+            (card_index, sid, user_id, card_index),
+        )
+        if cur.fetchone() is None:
+            # Nothing removed: tell a missing set apart from a bad index.
+            cur.execute("SELECT 1 FROM study_sets WHERE id = %s AND user_id = %s", (sid, user_id))
+            if cur.fetchone() is None:
+                return jsonify(error="not found"), 404
             return jsonify(error="invalid index"), 400
-        # remove the item
-        del existing[card_index]
-        cur.execute("UPDATE study_sets SET cards = %s WHERE id = %s", (json.dumps(existing), sid))
         conn.commit()
+        bump_list_cache("study_sets")
         cur.close()
         return ("", 204)
     except Exception as e:
@@ -1963,7 +3135,7 @@ def get_study_set(sid: int):
             return jsonify(error="not found"), 404
         sid_f, name, course_id, created_at, cards_json = row
         try:
-            cards = json.loads(cards_json) if isinstance(cards_json, str) else (cards_json or [])
+            cards = orjson.loads(cards_json) if isinstance(cards_json, str) else (cards_json or [])
         except Exception:
             cards = []
         return jsonify(id=sid_f, name=name, course_id=course_id, created_at=(created_at.isoformat() if created_at else None), cards=cards), 200
@@ -1990,6 +3162,7 @@ def delete_study_set(sid: int):
             conn.rollback()
             return jsonify(error="not found"), 404
         conn.commit()
+        bump_list_cache("study_sets")
         return ("", 204)
     except Exception as e:
         conn.rollback()
@@ -2026,19 +3199,24 @@ def create_flashcards_from_text():
         if not conn:
             return jsonify(error="Database connection error"), 500
         try:
+            # Encode the cards once; the same bytes go to Postgres and the response
+            name = title or "Flashcards"
+            cards_json = orjson.dumps(items)
             cur = conn.cursor()
             cur.execute(
                 """
                 INSERT INTO study_sets (name, course_id, user_id, cards)
-                VALUES (%s, %s, %s, %s)
+                VALUES (%s, %s, %s, %s::jsonb)
                 RETURNING id
                 """,
-                (title or "Flashcards", course_id, user_id, json.dumps(items)),
+                (name, course_id, user_id, cards_json.decode()),
             )
             sid = cur.fetchone()[0]
             conn.commit()
+            bump_list_cache("study_sets")
             cur.close()
-            return jsonify(id=sid, name=title or "Flashcards", cards=items), 200
+            body = b'{"id":%d,"name":%s,"cards":%s}' % (sid, orjson.dumps(name), cards_json)
+            return app.response_class(body, mimetype="application/json"), 200
         except Exception as e:
             conn.rollback()
             return jsonify(error=str(e)), 500
@@ -2087,6 +3265,7 @@ def create_note():
         )
         nid, updated_at = cur.fetchone()
         conn.commit()
+        bump_list_cache("notes")
         cur.close()
         return jsonify(id=nid, title=title, updated_at=(updated_at.isoformat() if updated_at else None)), 201
     except Exception as e:
@@ -2113,6 +3292,7 @@ def delete_note(nid: int):
             conn.rollback()
             return jsonify(error="not found"), 404
         conn.commit()
+        bump_list_cache("notes")
         return ("", 204)
     except Exception as e:
         conn.rollback()
@@ -2127,6 +3307,10 @@ def list_all_notes():
     user_id = session.get("user_id")
     if not user_id:
         return jsonify(error="unauthorized"), 401
+    cache_key = list_cache_key("notes")
+    items = _list_cache.get(cache_key)
+    if items is not None:
+        return jsonify(items=items), 200
     conn = get_connection()
     if not conn:
         return jsonify(error="Database connection error"), 500
@@ -2146,6 +3330,7 @@ def list_all_notes():
         items = [
             {"id": r[0], "title": r[1], "updated_at": (r[2].isoformat() if r[2] else None)} for r in rows
         ]
+        _list_cache.set(cache_key, items)
         return jsonify(items=items), 200
     except Exception as e:
         return jsonify(error=str(e)), 500
@@ -2200,6 +3385,7 @@ def rename_note(nid: int):
             conn.rollback()
             return jsonify(error="not found"), 404
         conn.commit()
+        bump_list_cache("notes")
         return jsonify(id=nid, title=title), 200
     except Exception as e:
         conn.rollback()
@@ -2213,6 +3399,11 @@ def rename_note(nid: int):
 # ============================================================================
 
 
+# Part of the /api/upload cache key; bump it whenever the
+# generate_topics_from_text prompt changes.
+TOPICS_PROMPT_VERSION = "1"
+
+
 def generate_topics_from_text(text: str, count: int = 10) -> list[str]:
     t = (text or "").strip()
     if not t:
@@ -2226,7 +3417,7 @@ def generate_topics_from_text(text: str, count: int = 10) -> list[str]:
         + t[:30000]
     )
     try:
-        resp = gemini_client.models.generate_content(
+        resp = gemini_generate(
             model="gemini-2.5-flash-lite",
             contents=prompt,
             config={
@@ -2444,6 +3635,10 @@ def get_quiz(qzid: int):
             ) if prior_stems else ""
             variety_note = "\n\nVARY question styles (conceptual, computational, edge cases), and increase complexity according to target difficulty."
             gen_input_summary = source_summary + topic_note + diff_note + harder_note + avoid_note + variety_note
+            # Gemini takes seconds here; hand the connection back (ending the
+            # read transaction) instead of pinning a pool slot while we wait.
+            cur.close()
+            conn.close()
             try:
                 fresh = generate_quiz_with_gemini(gen_input_summary, max(need * 2, need + 2), topic_list, topic_stats)
             except Exception:
@@ -2551,6 +3746,10 @@ def get_quiz(qzid: int):
                     if len(new_cleaned) >= need:
                         break
 
+            conn = get_connection()
+            if not conn:
+                return jsonify(error="Database connection error"), 500
+            cur = conn.cursor()
             if new_cleaned:
                 cur.execute("SELECT COALESCE(MAX(question_number), 0) FROM quiz_questions WHERE quiz_id = %s", (qzid,))
                 max_num = int(cur.fetchone()[0] or 0)
@@ -2690,7 +3889,8 @@ def get_quiz(qzid: int):
     except Exception as e:
         return jsonify(error=str(e)), 500
     finally:
-        conn.close()
+        if conn:
+            conn.close()
 
 
 @app.patch("/api/quizzes/<int:qid>")
@@ -2794,7 +3994,7 @@ def create_quiz():
 
         # Assign topics to generated questions when possible so progress can be computed per topic.
         # Prefer any topic Gemini returns per-question (q['topic']); otherwise, leave topic NULL.
-        inserted_question_ids: list[int] = []
+        question_rows: list[tuple] = []
         for i, q in enumerate(questions[:count], start=1):
             question = q.get("question")
             options = q.get("options") or []
@@ -2810,16 +4010,23 @@ def create_quiz():
                 assigned_topic = (str(raw_topic).strip() or None) if raw_topic is not None else None
             except Exception:
                 assigned_topic = None
-            cur.execute(
-                """
-                INSERT INTO quiz_questions (quiz_id, question_number, question, options, correct_answer, user_answer, is_correct, topic)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING id
-                """,
-                (quiz_id, i, question, options, correct_answer, None, None, assigned_topic),
-            )
-            qid = cur.fetchone()[0]
-            inserted_question_ids.append(qid)
+            question_rows.append((quiz_id, i, question, options, correct_answer, None, None, assigned_topic))
+        # One multi-row INSERT instead of a round trip per question; ids come back in row order.
+        inserted_question_ids: list[int] = []
+        if question_rows:
+            inserted_question_ids = [
+                r[0]
+                for r in psycopg2.extras.execute_values(
+                    cur,
+                    """
+                    INSERT INTO quiz_questions (quiz_id, question_number, question, options, correct_answer, user_answer, is_correct, topic)
+                    VALUES %s
+                    RETURNING id
+                    """,
+                    question_rows,
+                    fetch=True,
+                )
+            ]
         conn.commit()
         cur.close()
         return jsonify(quiz_id=quiz_id, questions=questions[:count], question_ids=inserted_question_ids[:count]), 200
@@ -3461,6 +4668,7 @@ def create_plan_from_topics():
         quiz_id = cur.fetchone()[0]
 
         # Insert quiz questions, assigning topics when present
+        question_rows: list[tuple] = []
         for i, q in enumerate(questions[:count], start=1):
             question = q.get("question")
             options = q.get("options") or []
@@ -3476,12 +4684,15 @@ def create_plan_from_topics():
                 assigned_topic = (str(raw_topic).strip() or None) if raw_topic is not None else None
             except Exception:
                 assigned_topic = None
-            cur.execute(
+            question_rows.append((quiz_id, i, question, options, correct_answer, None, None, assigned_topic))
+        if question_rows:
+            psycopg2.extras.execute_values(
+                cur,
                 """
                 INSERT INTO quiz_questions (quiz_id, question_number, question, options, correct_answer, user_answer, is_correct, topic)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                VALUES %s
                 """,
-                (quiz_id, i, question, options, correct_answer, None, None, assigned_topic),
+                question_rows,
             )
 
         conn.commit()
@@ -3933,6 +5144,7 @@ def dashboard_study_guides():
 @app.post("/api/upload")
 def upload():
     """Process uploaded files (PDF, images, text) and return extracted text and summary."""
+    tmp_path: str | None = None
     try:
         if "file" not in request.files:
             return jsonify(error="No 'file' part in form"), 400
@@ -3941,68 +5153,108 @@ def upload():
             return jsonify(error="No selected file"), 400
         filename = secure_filename(file.filename)
         mimetype = file.mimetype or "application/octet-stream"
-        file_bytes = file.read()
-        size = len(file_bytes)
+        # Spool the upload to disk in chunks instead of holding it in memory
+        # (the PDF extractors read from the path directly), hashing as we go so
+        # a repeat upload is answered from cache before any OCR or Gemini work.
+        fd, tmp_path = tempfile.mkstemp(prefix="learnnova-upload-", suffix=os.path.splitext(filename)[1])
+        h = hashlib.blake2b(digest_size=16)
+        # OCR settings, model and prompt versions are part of the key so
+        # changing any of them isn't masked by a result cached under the old ones.
+        h.update(f"v2|dpi={PDF_RENDER_DPI}|DOCUMENT_TEXT_DETECTION|gemini-2.5-flash-lite|".encode())
+        h.update(f"clean-v{CLEAN_PROMPT_VERSION}|summary-v{SUMMARY_PROMPT_VERSION}|topics-v{TOPICS_PROMPT_VERSION}|".encode())
+        h.update(f"{mimetype}|{os.path.splitext(filename)[1].lower()}|".encode())
+        size = 0
+        with os.fdopen(fd, "wb") as out:
+            while chunk := file.stream.read(1 << 20):
+                h.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+        cache_path = os.path.join(CACHE_DIR, "upload", f"{h.hexdigest()}.json")
+        entry = _cache_read(cache_path)
+        if entry is not None:
+            return jsonify(filename=filename, mimetype=mimetype, size=size, **entry["value"]), 200
 
         extracted_text = ""
         kind = "other"
+        sections: list[tuple[str, str]] = []
+        # False once any OCR/Gemini stage falls back to degraded output; such
+        # results are returned but not written to the upload cache.
+        extracted_ok = True
         if mimetype == "application/pdf" or filename.lower().endswith(".pdf"):
             kind = "pdf"
-            precomputed_summary: str | None = None
-            sections, _delineated = extract_sections_by_bookmarks(file_bytes)
+            sections, _delineated = extract_sections_by_bookmarks(tmp_path)
             if sections:
-                summaries: list[str] = []
-                for title, body in sections:
-                    sec_sum = summarize_text(body)
-                    if not sec_sum.strip():
-                        sec_sum = body[:1200]
-                    summaries.append(f"## {title}\n\n{sanitize_summary(sec_sum)}")
-                precomputed_summary = "\n\n".join(summaries)
                 extracted_text = "\n\n".join([b for _, b in sections])
             else:
-                extracted_text = extract_pdf_text(file_bytes)
+                extracted_text, extracted_ok = _extract_pdf_text(tmp_path)
         elif mimetype.startswith("image/") or filename.lower().endswith((".png", ".jpg", ".jpeg")):
             kind = "image"
             try:
-                extracted_text, conf = vision_ocr_from_images(file_bytes)
+                extracted_text, conf = vision_ocr_from_images(tmp_path)
             except Exception:
                 conf, extracted_text = 0.0, ""
             extracted_text = (extracted_text or "").strip()
             if (not extracted_text) or conf < 0.6 or ocr_quality_score(extracted_text) < 0.3:
                 return jsonify(error="OCR extraction quality too low. Try a higher-resolution image or clearer scan."), 400
             # Clean OCR text for readability
-            extracted_text = format_readable_text(clean_text_with_gemini(extracted_text))
+            extracted_text, extracted_ok = _clean_text(extracted_text)
+            extracted_text = format_readable_text(extracted_text)
         elif mimetype == "text/plain" or filename.lower().endswith(".txt"):
             kind = "text"
-            extracted_text = file_bytes.decode("utf-8", errors="ignore")
-            extracted_text = format_readable_text(clean_text_with_gemini(extracted_text))
+            with open(tmp_path, "rb") as f:
+                extracted_text = f.read().decode("utf-8", errors="ignore")
+            extracted_text, extracted_ok = _clean_text(extracted_text)
+            extracted_text = format_readable_text(extracted_text)
         else:
             try:
-                extracted_text = file_bytes.decode("utf-8", errors="ignore")
-                extracted_text = format_readable_text(clean_text_with_gemini(extracted_text))
+                with open(tmp_path, "rb") as f:
+                    extracted_text = f.read().decode("utf-8", errors="ignore")
+                extracted_text, extracted_ok = _clean_text(extracted_text)
+                extracted_text = format_readable_text(extracted_text)
             except Exception:
                 extracted_text = ""
 
         if not extracted_text or not extracted_text.strip():
             return jsonify(error="No text could be extracted from the file"), 400
 
-        summary = precomputed_summary if (kind == "pdf" and 'precomputed_summary' in locals() and precomputed_summary) else summarize_text(extracted_text)
-        base_for_topics = extracted_text if extracted_text else summary
-        topics = generate_topics_from_text(base_for_topics, count=10)
-        return jsonify(
-            filename=filename,
-            mimetype=mimetype,
-            size=size,
-            kind=kind,
-            summary=summary,
-            topics=topics,
-            extracted_text=extracted_text,
-        ), 200
+        def summarize_upload() -> tuple[str, bool]:
+            """The upload's summary plus whether every section summarized successfully."""
+            if not sections:
+                return _summarize_text(extracted_text)
+            # Sections are independent; summarize them concurrently (Gemini
+            # quota is enforced per call by gemini_slot). map keeps order.
+            with ThreadPoolExecutor(max_workers=min(GEMINI_MAX_CONCURRENCY, len(sections))) as ex:
+                section_sums = list(ex.map(_summarize_text, [b for _, b in sections]))
+            summaries: list[str] = []
+            all_ok = True
+            for (title, body), (sec_sum, sec_ok) in zip(sections, section_sums):
+                if not sec_sum.strip():
+                    sec_sum, sec_ok = body[:1200], False
+                all_ok = all_ok and sec_ok
+                summaries.append(f"## {title}\n\n{sanitize_summary(sec_sum)}")
+            return "\n\n".join(summaries), all_ok
+
+        # Topics are drawn from the extracted text, not the summary, so both
+        # Gemini requests run side by side instead of back to back.
+        with ThreadPoolExecutor(max_workers=2) as ex:
+            topics_future = ex.submit(generate_topics_from_text, extracted_text, 10)
+            summary, summary_ok = summarize_upload()
+            topics = topics_future.result()
+        result = {"kind": kind, "summary": summary, "topics": topics, "extracted_text": extracted_text}
+        if extracted_ok and summary_ok and summary and topics:
+            _cache_write(cache_path, result)
+        return jsonify(filename=filename, mimetype=mimetype, size=size, **result), 200
     except Exception as e:
         msg = str(e)
         if "file too large to be summarized." in msg:
             return jsonify(error="file too large to be summarized."), 400
         return jsonify(error=msg), 500
+    finally:
+        if tmp_path:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
 
 
 # ============================================================================
@@ -4317,7 +5569,7 @@ def chat_endpoint():
         style_prefix = ("\n".join(instructions).strip() + "\n\n") if instructions else ""
         prompt = f"{style_prefix}{content}"
 
-        resp = gemini_client.models.generate_content(
+        resp = gemini_generate(
             model="gemini-2.5-flash-lite",
             contents=prompt,
         )
@@ -4443,7 +5695,7 @@ def get_ai_resources():
     )
 
     try:
-        resp = gemini_client.models.generate_content(
+        resp = gemini_generate(
             model="gemini-2.5-flash-lite",
             contents=prompt,
         )
@@ -4516,4 +5768,7 @@ def not_found(e):
 # ============================================================================
 
 if __name__ == "__main__":
-    app.run(host="127.0.0.1", port=5050, debug=True)
\ No newline at end of file
+    # Handlers spend most of their time waiting on Gemini/Vision (I/O that
+    # releases the GIL), so a thread per request keeps one slow upload from
+    # blocking other clients.
+    app.run(host="127.0.0.1", port=5050, debug=True, threaded=True)
\ No newline at end of file
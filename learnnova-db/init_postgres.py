@@ -313,6 +313,23 @@ def create_tables():
             conn.commit()
         except Exception:
             conn.rollback()
+        # Indexes for the per-user listing and progress queries
+        try:
+            cur.execute(
+                """
+                CREATE INDEX IF NOT EXISTS users_username_idx ON users (username);
+                CREATE INDEX IF NOT EXISTS quizzes_created_by_course_idx ON quizzes (created_by, course_id);
+                CREATE INDEX IF NOT EXISTS quiz_questions_quiz_topic_idx ON quiz_questions (quiz_id, lower(TRIM(COALESCE(topic, ''))));
+                CREATE INDEX IF NOT EXISTS courses_created_by_idx ON courses (created_by, id);
+                CREATE INDEX IF NOT EXISTS study_sets_user_created_idx ON study_sets (user_id, created_at DESC NULLS LAST);
+                CREATE INDEX IF NOT EXISTS study_guides_user_created_idx ON study_guides (user_id, created_at DESC NULLS LAST);
+                CREATE INDEX IF NOT EXISTS notes_user_created_idx ON notes (user_id, created_at DESC NULLS LAST);
+                CREATE INDEX IF NOT EXISTS summaries_user_created_idx ON summaries (user_id, created_at DESC NULLS LAST);
+                """
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
         print("Postgres database initialized successfully. Tables: users, courses, topics, quizzes, quiz_questions, notes, summaries, study_guides, study_sets, chat_threads, chat_messages")
     except Exception as e:
         conn.rollback()
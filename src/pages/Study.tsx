@@ -20,7 +20,7 @@ import {
 
 type RecentItem = { type: 'study_set' | 'study_guide' | 'note' | 'summary'; id: number; name?: string; title?: string; created_at?: string };
 type RecentResponse = { items?: RecentItem[]; error?: string };
-type StudySetListItem = { id: number; name?: string; course?: { name?: string }; cards?: unknown[]; cardsCount?: number };
+type StudySetListItem = { id: number; name?: string; course?: { name?: string }; cards?: unknown[]; cardsCount?: number; card_count?: number };
 type StudySetListResponse = { items?: StudySetListItem[]; error?: string };
 type Course = { id: number; name: string };
 
@@ -126,17 +126,12 @@ const Study = () => {
         if (!mounted) return;
         if (!res.ok) throw new Error(data?.error || `Failed to load sets (${res.status})`);
         const items: StudySetListItem[] = Array.isArray(data?.items) ? data.items! : [];
-        // For each set, optionally fetch details to get card count and course
-        const enriched = await Promise.all(items.map(async (it) => {
-          try {
-            const r = await fetch(`/api/study_sets/${it.id}`, { credentials: 'include' });
-            const j = (await r.json().catch(() => ({}))) as unknown as { cards?: unknown[]; course?: { name?: string } };
-            const cardsCount = Array.isArray(j?.cards) ? j.cards!.length : (typeof it.cardsCount === 'number' ? it.cardsCount! : 0);
-            const courseName = j?.course?.name || it?.course?.name || undefined;
-            return { id: Number(it.id), name: String(it.name || `Set #${it.id}`), cardsCount, courseName };
-          } catch {
-            return { id: Number(it.id), name: String(it.name || `Set #${it.id}`), cardsCount: 0, courseName: undefined };
-          }
+        // The list already carries card_count; cards load on demand when a set is opened
+        const enriched = items.map((it) => ({
+          id: Number(it.id),
+          name: String(it.name || `Set #${it.id}`),
+          cardsCount: typeof it.card_count === 'number' ? it.card_count : (typeof it.cardsCount === 'number' ? it.cardsCount : (Array.isArray(it.cards) ? it.cards.length : 0)),
+          courseName: it?.course?.name || undefined,
         }));
         setStudySets(enriched);
       } catch (e: unknown) {